@@ -0,0 +1,180 @@
+"""
+Бенчмарк обработки больших документов: пиковая память (RSS) и время.
+
+Файл 20 МБ (текст и PDF) скачивается с локального фейкового сервера
+Telegram тем же путем, что в handle_document: в new_spool, затем
+iter_text_chunks для текста или upload_spool в фейковый Gemini File API
+для PDF. Для сравнения тот же файл обрабатывается целиком в памяти, как
+раньше делал обработчик фото.
+
+Каждый замер идет в отдельном процессе: ru_maxrss - пик за всю жизнь
+процесса, его нельзя сбросить между замерами.
+
+    python benchmarks/bench_documents.py --size-mb 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("TELEGRAM_TOKEN", "42:BENCH")
+os.environ.setdefault("GEMINI_API_KEY", "bench-key-0000")
+os.environ["GEMINI_TRANSPORT"] = "rest"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+
+CASES = ('text-streamed', 'pdf-streamed', 'text-buffered', 'pdf-buffered')
+
+
+def rss_mb() -> float:
+    # На Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_files(directory: str, size_mb: int) -> dict:
+    """Файлы пишутся на диск кусками, чтобы не держать их в памяти сервера"""
+    line = "2024-05-01 12:00:00 INFO запрос обработан за 12 мс, пользователь 12345\n".encode()
+    block = line * (1024 * 1024 // len(line))
+    paths = {}
+    for name, header in (("log.txt", b""), ("doc.pdf", b"%PDF-1.7\n")):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(header)
+            for _ in range(size_mb):
+                f.write(block)
+        paths[name] = path
+    return paths
+
+
+# --- ФЕЙКОВЫЕ СЕРВЕРЫ (в родительском процессе) ---
+def start_servers(paths: dict):
+    from tests.fakes import FakeGemini
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    state = {}
+
+    async def get_file(request):
+        file_id = (await request.post())["file_id"]
+        return web.json_response({"ok": True, "result": {
+            "file_id": file_id, "file_unique_id": file_id,
+            "file_size": os.path.getsize(paths[file_id]), "file_path": file_id,
+        }})
+
+    async def download(request):
+        return web.FileResponse(paths[request.match_info["path"]])
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/bot{token}/getFile", get_file)
+        app.router.add_get("/file/bot{token}/{path}", download)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        state['telegram'] = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        gemini = FakeGemini()
+        await gemini.server.start_server()
+        state['gemini'] = gemini.base
+        state['uploads'] = gemini.uploads
+        ready.set()
+
+    threading.Thread(target=lambda: (loop.run_until_complete(serve()), loop.run_forever()), daemon=True).start()
+    ready.wait()
+    return state
+
+
+# --- ЗАМЕР (в дочернем процессе) ---
+async def run_case(case: str, telegram: str, gemini: str) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from google.generativeai import client as genai_client
+
+    from config import DOCUMENT_CHUNK_SIZE, DOCUMENT_MAX_TOKENS
+    from handlers.gemini_handlers import upload_spool
+    from utils.file_streaming import new_spool, iter_text_chunks
+    from utils.key_pool import key_pool
+
+    genai_client.GENAI_API_DISCOVERY_URL = f"{gemini}/$discovery/rest"
+    key = key_pool.keys[0]
+    key._clients.configure(api_key=key.key, transport="rest", client_options={"api_endpoint": gemini})
+    session = AiohttpSession(api=TelegramAPIServer.from_base(telegram))
+    bot = Bot(token=os.environ["TELEGRAM_TOKEN"], session=session)
+
+    is_text = case.startswith("text")
+    file_id = "log.txt" if is_text else "doc.pdf"
+    mime_type = "text/plain" if is_text else "application/pdf"
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    try:
+        if case.endswith("streamed"):
+            with new_spool() as spool:
+                await bot.download(file_id, destination=spool, chunk_size=DOCUMENT_CHUNK_SIZE)
+                if is_text:
+                    await asyncio.to_thread(iter_text_chunks, spool, DOCUMENT_MAX_TOKENS)
+                else:
+                    await upload_spool(spool, mime_type, file_id, key)
+        else:
+            data = await bot.download(file_id)
+            if is_text:
+                data.getvalue().decode("utf-8", errors="replace")
+            else:
+                await asyncio.to_thread(key.file_client.create_file, data, mime_type=mime_type, display_name=file_id)
+    finally:
+        await session.close()
+
+    return {
+        'case': case,
+        'seconds': time.perf_counter() - started,
+        'baseline_mb': baseline,
+        'peak_mb': rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--telegram", help=argparse.SUPPRESS)
+    parser.add_argument("--gemini", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(asyncio.run(run_case(args.case, args.telegram, args.gemini))))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-docs-") as directory:
+        servers = start_servers(write_files(directory, args.size_mb))
+        results = []
+        for case in CASES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--case", case, "--telegram", servers['telegram'], "--gemini", servers['gemini']],
+                stdout=subprocess.PIPE, text=True, check=True, cwd=ROOT,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        # Проверка, что PDF действительно дошел до File API целиком
+        uploaded = [len(upload['content']) / 1024 / 1024 for upload in servers['uploads'].values()]
+
+    print(f"Файл: {args.size_mb} МБ, загружено в File API: {', '.join(f'{size:.1f} МБ' for size in uploaded)}")
+    print(f"{'режим':<16}{'время, с':>10}{'RSS до, МБ':>12}{'пик RSS, МБ':>13}{'прирост, МБ':>13}")
+    for r in results:
+        print(
+            f"{r['case']:<16}{r['seconds']:>10.2f}{r['baseline_mb']:>12.1f}"
+            f"{r['peak_mb']:>13.1f}{r['peak_mb'] - r['baseline_mb']:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
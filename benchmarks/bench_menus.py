@@ -0,0 +1,118 @@
+"""
+Бенчмарк /start, /help, /models и навигации по меню моделей.
+
+Обновления проходят через Dispatcher.feed_update с настоящими хэндлерами;
+сессия Bot подменена заглушкой без сети, поэтому замер показывает только
+стоимость обработки на стороне бота. Отдельно сравнивается выбор готовой
+клавиатуры из utils.menus и ее сборка на каждое нажатие (как было раньше).
+
+    python benchmarks/bench_menus.py --updates 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_TOKEN", "42:BENCH")
+os.environ.setdefault("GEMINI_API_KEY", "bench-key-0000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+from handlers.gemini_handlers import router
+from utils import menus
+
+USER = {"id": 5, "is_bot": False, "first_name": "Ann"}
+CHAT = {"id": 5, "type": "private"}
+
+
+class NullSession(BaseSession):
+    """Сессия без сети: запросы к Telegram сразу завершаются"""
+
+    async def make_request(self, bot, method, timeout=None):
+        return None
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def command(text: str) -> dict:
+    return {"message": {
+        "message_id": 1, "date": int(time.time()), "chat": CHAT, "from": USER, "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+    }}
+
+
+def callback(data: str) -> dict:
+    return {"callback_query": {
+        "id": "1", "from": USER, "chat_instance": "1", "data": data,
+        "message": {"message_id": 2, "date": int(time.time()), "chat": CHAT, "text": "menu"},
+    }}
+
+
+SCENARIOS = {
+    "/start": command("/start"),
+    "/help": command("/help"),
+    "/models": command("/models"),
+    "category_text": callback("category_text"),
+    "models_back": callback("models_back"),
+}
+
+
+async def bench_updates(updates: int) -> dict:
+    bot = Bot(token=os.environ["TELEGRAM_TOKEN"], session=NullSession())
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    results = {}
+    for name, payload in SCENARIOS.items():
+        update = Update.model_validate({"update_id": 1, **payload}, context={"bot": bot})
+        samples = []
+        for _ in range(updates):
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            samples.append((time.perf_counter() - started) * 1e6)
+        results[name] = samples
+    return results
+
+
+def bench_render(iterations: int) -> tuple[float, float]:
+    """Сборка клавиатуры текстовых моделей против выбора готовой, мкс"""
+    current = next(iter(menus.TEXT_MODELS))
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        menus._text_models_markup(menus.TEXT_MODELS, current)
+    rebuilt = (time.perf_counter() - started) / iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        menus.TEXT_MODELS_MARKUPS[current]
+    cached = (time.perf_counter() - started) / iterations * 1e6
+    return rebuilt, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000, help="обновлений на сценарий")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench_updates(args.updates))
+    print(f"{'сценарий':<16}{'p50, мкс':>10}{'p95, мкс':>10}")
+    for name, samples in results.items():
+        samples.sort()
+        print(f"{name:<16}{statistics.median(samples):>10.1f}{samples[int(len(samples) * 0.95)]:>10.1f}")
+
+    rebuilt, cached = bench_render(args.updates)
+    print(f"\nКлавиатура текстовых моделей: сборка {rebuilt:.2f} мкс, готовая {cached:.3f} мкс")
+
+
+if __name__ == "__main__":
+    main()
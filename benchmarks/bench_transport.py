@@ -0,0 +1,218 @@
+"""
+Бенчмарк транспорта Gemini: gRPC против REST на локальном фейковом сервере.
+
+Для каждого транспорта измеряется первый запрос на новом клиенте (установка
+канала и TLS - то, что снимает прогрев в on_startup) и задержка в устойчивом
+режиме. Клиенты создаются так же, как в боте (ApiKey из utils.key_pool),
+меняется только адрес сервера. Оба сервера работают по TLS с самоподписанным
+сертификатом, чтобы первый запрос платил за handshake, как в проде.
+
+    python benchmarks/bench_transport.py --requests 200
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+os.environ.setdefault("TELEGRAM_TOKEN", "42:BENCH")
+os.environ.setdefault("GEMINI_API_KEY", "bench-key-0000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CERT_DIR = tempfile.mkdtemp(prefix="bench-tls-")
+CERT_FILE = os.path.join(CERT_DIR, "cert.pem")
+KEY_FILE = os.path.join(CERT_DIR, "key.pem")
+# Корневые сертификаты читаются при создании первого канала - задаем заранее
+os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = CERT_FILE
+os.environ["REQUESTS_CA_BUNDLE"] = CERT_FILE
+
+import grpc
+from aiohttp import web
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from google.generativeai import protos
+
+from utils.key_pool import ApiKey
+
+MODEL = "gemini-1.5-flash"
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+REPLY = "Ответ фейкового сервера"
+USAGE = {"promptTokenCount": 5, "candidatesTokenCount": 4, "totalTokenCount": 9}
+
+
+def write_self_signed_cert():
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    with open(CERT_FILE, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(KEY_FILE, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+# --- ФЕЙКОВЫЕ СЕРВЕРЫ ---
+def start_grpc_server(port: int, delay: float):
+    def generate_content(request, context):
+        time.sleep(delay)
+        return protos.GenerateContentResponse(
+            candidates=[{"content": {"role": "model", "parts": [{"text": REPLY}]}, "finish_reason": 1}],
+            usage_metadata={"prompt_token_count": 5, "candidates_token_count": 4, "total_token_count": 9},
+        )
+
+    def count_tokens(request, context):
+        time.sleep(delay)
+        return protos.CountTokensResponse(total_tokens=1)
+
+    def unary(fn, request_type, response_type):
+        return grpc.unary_unary_rpc_method_handler(
+            fn,
+            request_deserializer=request_type.deserialize,
+            response_serializer=response_type.serialize,
+        )
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(SERVICE, {
+        "GenerateContent": unary(generate_content, protos.GenerateContentRequest, protos.GenerateContentResponse),
+        "CountTokens": unary(count_tokens, protos.CountTokensRequest, protos.CountTokensResponse),
+    })])
+    with open(KEY_FILE, "rb") as key, open(CERT_FILE, "rb") as cert:
+        credentials = grpc.ssl_server_credentials([(key.read(), cert.read())])
+    server.add_secure_port(f"localhost:{port}", credentials)
+    server.start()
+    return server
+
+
+def start_rest_server(port: int, delay: float):
+    import ssl
+
+    async def model_action(request):
+        _, _, action = request.match_info["action"].partition(":")
+        await request.read()
+        await asyncio.sleep(delay)
+        if action == "countTokens":
+            return web.json_response({"totalTokens": 1})
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": REPLY}]}, "finishReason": 1}],
+            "usageMetadata": USAGE,
+        })
+
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(CERT_FILE, KEY_FILE)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/v1beta/models/{action}", model_action)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "localhost", port, ssl_context=ssl_context).start()
+        ready.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(serve()), loop.run_forever()), daemon=True)
+    thread.start()
+    ready.wait()
+    return loop
+
+
+# --- ИЗМЕРЕНИЯ ---
+def new_model(transport: str, endpoint: str):
+    """Новый клиент - как у ключа в пуле бота, но на локальный сервер"""
+    key = ApiKey(0, "bench-key-0000")
+    key._clients.configure(api_key=key.key, transport=transport, client_options={"api_endpoint": endpoint})
+    return key.model(MODEL)
+
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def bench(transport: str, endpoint: str, requests: int, rounds: int) -> dict:
+    # Первый запрос: каждый раз новый клиент, канал и TLS-сессия
+    cold = []
+    for _ in range(rounds):
+        model = new_model(transport, endpoint)
+        cold.append(timed(lambda: model.generate_content("привет")))
+
+    # Устойчивый режим: один прогретый клиент
+    model = new_model(transport, endpoint)
+    model.count_tokens("ping")
+    steady = [timed(lambda: model.generate_content("привет")) for _ in range(requests)]
+    pings = [timed(lambda: model.count_tokens("ping")) for _ in range(requests)]
+
+    return {
+        'transport': transport,
+        'first_ms': statistics.median(cold),
+        'steady_p50_ms': statistics.median(steady),
+        'steady_p95_ms': percentile(steady, 0.95),
+        'ping_p50_ms': statistics.median(pings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="запросов в устойчивом режиме")
+    parser.add_argument("--rounds", type=int, default=20, help="замеров первого запроса (новый клиент каждый раз)")
+    parser.add_argument("--server-delay-ms", type=float, default=0.0, help="искусственная задержка ответа сервера")
+    args = parser.parse_args()
+
+    write_self_signed_cert()
+    delay = args.server_delay_ms / 1000
+    grpc_port, rest_port = free_port(), free_port()
+    grpc_server = start_grpc_server(grpc_port, delay)
+    rest_loop = start_rest_server(rest_port, delay)
+
+    try:
+        results = [
+            bench("grpc", f"localhost:{grpc_port}", args.requests, args.rounds),
+            bench("rest", f"localhost:{rest_port}", args.requests, args.rounds),
+        ]
+    finally:
+        grpc_server.stop(None)
+        rest_loop.call_soon_threadsafe(rest_loop.stop)
+
+    print(f"{'транспорт':<10}{'первый, мс':>12}{'p50, мс':>10}{'p95, мс':>10}{'пинг p50':>10}")
+    for r in results:
+        print(
+            f"{r['transport']:<10}{r['first_ms']:>12.2f}{r['steady_p50_ms']:>10.2f}"
+            f"{r['steady_p95_ms']:>10.2f}{r['ping_p50_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,13 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 if not TELEGRAM_TOKEN:
     raise ValueError("❌ TELEGRAM_TOKEN не найден в .env")
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+# Несколько ключей через запятую в GEMINI_API_KEYS, либо один в GEMINI_API_KEY
+GEMINI_API_KEYS = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()]
+if not GEMINI_API_KEYS and os.getenv("GEMINI_API_KEY"):
+    GEMINI_API_KEYS = [os.getenv("GEMINI_API_KEY")]
+if not GEMINI_API_KEYS:
     raise ValueError("❌ GEMINI_API_KEY не найден в .env")
+GEMINI_API_KEY = GEMINI_API_KEYS[0]
 
 # === АДМИНИСТРАТОРЫ ===
 ADMIN_IDS_STR = os.getenv("ADMIN_IDS", "")
@@ -30,15 +34,103 @@ if LOG_LEVEL not in VALID_LOG_LEVELS:
     LOG_LEVEL = "INFO"
 
 LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", "5"))
+# Записи сверх размера очереди отбрасываются, чтобы не блокировать event loop
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Доля INFO-записей, которая пишется из шумных логгеров
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_SAMPLED_LOGGERS = tuple(
+    name.strip() for name in os.getenv("LOG_SAMPLED_LOGGERS", "aiogram.event,aiohttp.access").split(",") if name.strip()
+)
 
 # === НАСТРОЙКИ БОТА ===
 MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "30"))
 GEMINI_TIMEOUT = int(os.getenv("GEMINI_TIMEOUT", "60"))
 SESSION_LIFETIME_HOURS = int(os.getenv("SESSION_LIFETIME_HOURS", "24"))
+# Inline-режим: пауза в наборе перед запросом к Gemini и кэш ответов
+INLINE_DEBOUNCE_MS = int(os.getenv("INLINE_DEBOUNCE_MS", "700"))
+INLINE_CACHE_TTL_SECONDS = int(os.getenv("INLINE_CACHE_TTL_SECONDS", "120"))
+INLINE_CACHE_MAX = int(os.getenv("INLINE_CACHE_MAX", "1000"))
+INLINE_MIN_QUERY_LENGTH = int(os.getenv("INLINE_MIN_QUERY_LENGTH", "3"))
+# Общая история группового чата (обрезается независимо от личных)
+GROUP_HISTORY_MESSAGES = int(os.getenv("GROUP_HISTORY_MESSAGES", "20"))
 
 # Модель по умолчанию
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gemini-1.5-flash")
 
+# Общий лимит одновременных запросов к Gemini (Telegram + HTTP API)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Транспорт клиента Gemini: grpc или rest
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "grpc").lower()
+if GEMINI_TRANSPORT not in ("grpc", "rest"):
+    GEMINI_TRANSPORT = "grpc"
+# Лимит запросов в минуту на ключ (0 - без ограничения)
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "0"))
+# Ключ с 429 или ошибкой доступа выводится из ротации и проверяется не раньше чем через
+GEMINI_KEY_COOLDOWN_SECONDS = int(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "60"))
+GEMINI_KEY_PROBE_INTERVAL_SECONDS = int(os.getenv("GEMINI_KEY_PROBE_INTERVAL_SECONDS", "15"))
+# Интервал пингов в простое, чтобы соединение не остывало (0 - выключено)
+GEMINI_KEEPALIVE_SECONDS = int(os.getenv("GEMINI_KEEPALIVE_SECONDS", "240"))
+
+# === ИСХОДЯЩИЕ СООБЩЕНИЯ TELEGRAM ===
+# Лимиты Telegram: ~30 сообщений/с всего, ~1/с в личный чат, ~20/мин в группу
+TELEGRAM_GLOBAL_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_PER_SECOND", "30"))
+TELEGRAM_CHAT_PER_SECOND = float(os.getenv("TELEGRAM_CHAT_PER_SECOND", "1"))
+TELEGRAM_GROUP_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_PER_MINUTE", "20"))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", "3"))
+# Размер пула соединений к Bot API
+TELEGRAM_CONNECTION_LIMIT = int(os.getenv("TELEGRAM_CONNECTION_LIMIT", "100"))
+
+# === СТОРОЖ EVENT LOOP ===
+LOOP_LAG_INTERVAL_MS = int(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+# Зависание дольше порога логируется со стеком блокирующего кода
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+# При такой задержке health-check отвечает 503, и балансировщик снимает инстанс
+LOOP_LAG_UNHEALTHY_MS = int(os.getenv("LOOP_LAG_UNHEALTHY_MS", "1000"))
+
+# === HTTP API ===
+# Без токена HTTP API не включается
+API_TOKEN = os.getenv("API_TOKEN", "")
+API_BATCH_MAX_PROMPTS = int(os.getenv("API_BATCH_MAX_PROMPTS", "50"))
+
+# === УЧЕТ ТОКЕНОВ И КВОТЫ ===
+# Дневной бюджет токенов (вход + выход) на пользователя, 0 - без ограничений
+USAGE_DAILY_TOKENS_PER_USER = int(os.getenv("USAGE_DAILY_TOKENS_PER_USER", "0"))
+# При достижении этой доли бюджета запросы переводятся на более дешевую модель
+USAGE_DOWNGRADE_ENABLED = os.getenv("USAGE_DOWNGRADE_ENABLED", "false").lower() in ("1", "true", "yes")
+USAGE_DOWNGRADE_THRESHOLD = float(os.getenv("USAGE_DOWNGRADE_THRESHOLD", "0.8"))
+USAGE_DOWNGRADE_MODEL = os.getenv("USAGE_DOWNGRADE_MODEL", "gemini-1.5-flash")
+
+# === ГЕНЕРАЦИЯ ИЗОБРАЖЕНИЙ ===
+# Imagen работает в отдельной очереди и не занимает хэндлеры текстового чата
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_MAX = int(os.getenv("IMAGE_QUEUE_MAX", "50"))
+IMAGE_JOBS_PER_USER = int(os.getenv("IMAGE_JOBS_PER_USER", "2"))
+IMAGE_MAX_VARIANTS = int(os.getenv("IMAGE_MAX_VARIANTS", "4"))
+
+# === ДОКУМЕНТЫ ===
+# Лимит Telegram Bot API на скачивание файлов - 20 МБ
+DOCUMENT_MAX_SIZE_MB = int(os.getenv("DOCUMENT_MAX_SIZE_MB", "20"))
+# До этого размера файл держится в памяти, дальше - во временном файле на диске
+DOCUMENT_SPOOL_MAX_BYTES = int(os.getenv("DOCUMENT_SPOOL_MAX_BYTES", str(1024 * 1024)))
+DOCUMENT_CHUNK_SIZE = int(os.getenv("DOCUMENT_CHUNK_SIZE", "65536"))
+DOCUMENT_MAX_TOKENS = int(os.getenv("DOCUMENT_MAX_TOKENS", "200000"))
+DOCUMENT_MAX_CONCURRENCY = int(os.getenv("DOCUMENT_MAX_CONCURRENCY", "4"))
+
+# === ГОЛОСОВЫЕ И АУДИО ===
+VOICE_MAX_DURATION_SECONDS = int(os.getenv("VOICE_MAX_DURATION_SECONDS", "300"))
+AUDIO_MAX_DURATION_SECONDS = int(os.getenv("AUDIO_MAX_DURATION_SECONDS", "900"))
+
+# === ДОГОНЯЮЩАЯ ОБРАБОТКА ПОСЛЕ РЕСТАРТА ===
+CATCHUP_ENABLED = os.getenv("CATCHUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Сообщения старше этого возраста не обрабатываются, пользователь получает уведомление
+CATCHUP_MAX_AGE_SECONDS = int(os.getenv("CATCHUP_MAX_AGE_SECONDS", "600"))
+CATCHUP_CONCURRENCY = int(os.getenv("CATCHUP_CONCURRENCY", "4"))
+CATCHUP_MAX_UPDATES = int(os.getenv("CATCHUP_MAX_UPDATES", "1000"))
+
 def validate_config():
     """Проверка конфигурации"""
     errors = []
@@ -57,6 +149,7 @@ def validate_config():
     print(f"   🤖 Режим: {'Production' if LOG_LEVEL != 'DEBUG' else 'Debug'}")
     print(f"   📊 Логирование: {LOG_LEVEL} -> {LOG_FILE}")
     print(f"   👑 Администраторов: {len(ADMIN_IDS)}")
+    print(f"   🔑 Ключей Gemini: {len(GEMINI_API_KEYS)}")
     print(f"   🧠 Модель по умолчанию: {DEFAULT_MODEL}")
 
 # Автопроверка
@@ -1,261 +1,138 @@
 import os
 import logging
 import asyncio # Добавлен для asyncio.to_thread
-from datetime import datetime
+import hashlib
 from io import BytesIO
 from aiogram import F, Router
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardMarkup,
+    InlineQuery, InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent,
+)
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
-import google.generativeai as genai
+from aiogram.exceptions import TelegramBadRequest
 from PIL import Image
-import requests
 
-from config import MAX_HISTORY_MESSAGES, GEMINI_TIMEOUT
+from config import (
+    MAX_HISTORY_MESSAGES, DEFAULT_MODEL, ADMIN_IDS, IMAGE_MAX_VARIANTS, IMAGE_JOBS_PER_USER, USAGE_DAILY_TOKENS_PER_USER,
+    VOICE_MAX_DURATION_SECONDS, AUDIO_MAX_DURATION_SECONDS,
+    DOCUMENT_MAX_SIZE_MB, DOCUMENT_CHUNK_SIZE, DOCUMENT_MAX_TOKENS, DOCUMENT_MAX_CONCURRENCY,
+    INLINE_MIN_QUERY_LENGTH, INLINE_CACHE_TTL_SECONDS,
+)
 # ИСПРАВЛЕННЫЙ ИМПОРТ:
-from utils.session_manager import user_sessions, UserSession
+from utils.session_manager import user_sessions, chat_sessions, UserSession
+from utils.usage import reset_daily_usage, total_tokens, top_consumers, model_usage
+from utils.gemini_engine import (
+    GEMINI_MODELS, EngineError, ImageModelSelected, VisionNotSupported, BudgetExceeded,
+    get_session, touch, resolve_model, chat, complete, analyze, voice_reply,
+)
+from utils.key_pool import key_pool
+from utils.group_chat import (
+    GROUP_CHAT_TYPES, ADDRESSED, group_stats, classify, count, get_chat_session, group_prompt, api_share,
+)
+from utils.inline_queries import inline_debouncer, normalize_query
+from utils.menus import (
+    HELP_TEXT, START_TEXTS, MODELS_TEXTS, SELECTED_TEXTS, MODELS_MARKUP,
+    TEXT_MODELS_TEXT, TEXT_MODELS_MARKUPS, IMAGE_MODELS_TEXT, IMAGE_MODELS_MARKUP,
+)
+from utils.image_jobs import image_queue, ImageJob, QueueFull, UserLimitReached, CANCEL_PREFIX
+from utils.file_streaming import (
+    guess_mime_type, is_text_document, is_binary_supported, new_spool, iter_text_chunks,
+)
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-# --- ДОСТУПНЫЕ МОДЕЛИ GEMINI ---
-GEMINI_MODELS = {
-    'gemini-1.5-flash': {
-        'name': 'Gemini 1.5 Flash',
-        'model_id': 'gemini-1.5-flash',
-        'description': '⚡ Быстрая и умная модель для любых задач',
-        'supports_vision': True,
-        'supports_image_gen': False,
-        'max_tokens': 8192,
-        'category': 'text'
-    },
-    'gemini-1.5-pro': {
-        'name': 'Gemini 1.5 Pro',
-        'model_id': 'gemini-1.5-pro',
-        'description': '🎯 Продвинутая модель для сложных запросов',
-        'supports_vision': True,
-        'supports_image_gen': False,
-        'max_tokens': 8192,
-        'category': 'text'
-    },
-    'gemini-2.0-flash-exp': {
-        'name': 'Gemini 2.0 Flash',
-        'model_id': 'gemini-2.0-flash-exp',
-        'description': '🚀 Экспериментальная модель 2.0',
-        'supports_vision': True,
-        'supports_image_gen': False,
-        'max_tokens': 8192,
-        'category': 'text'
-    },
-    'gemini-3.0-flash': {
-        'name': 'Gemini 3.0 Flash',
-        'model_id': 'gemini-3.0-flash',
-        'description': '🌟 Самая новая и мощная модель',
-        'supports_vision': True,
-        'supports_image_gen': False,
-        'max_tokens': 8192,
-        'category': 'text'
-    },
-    'imagen-3': {
-        'name': 'Imagen 3',
-        'model_id': 'imagen-3',
-        'description': '🎨 Генерация изображений по описанию',
-        'supports_vision': False,
-        'supports_image_gen': True,
-        'max_tokens': 2048,
-        'category': 'image'
-    }
-}
+# Ограничиваем число документов, обрабатываемых одновременно
+document_semaphore = asyncio.Semaphore(DOCUMENT_MAX_CONCURRENCY)
 
 # --- КОМАНДЫ ---
+def session_owner(chat, user_id: int):
+    """Где хранится сессия: в группе общая сессия чата, иначе личная"""
+    if chat.type in GROUP_CHAT_TYPES:
+        return chat_sessions, chat.id
+    return user_sessions, user_id
+
+def owner_session(chat, user_id: int) -> UserSession:
+    """Получить или создать сессию, на которой отвечает бот в этом чате"""
+    if chat.type in GROUP_CHAT_TYPES:
+        return get_chat_session(chat.id)
+    return get_session(user_id)
+
+def current_model(chat, user_id: int) -> str:
+    """Текущая модель без создания сессии"""
+    sessions, owner_id = session_owner(chat, user_id)
+    session = sessions.get(owner_id)
+    return session.current_model if session else DEFAULT_MODEL
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    user_id = message.from_user.id
-    
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
-    
-    session = user_sessions[user_id]
-    model_name = GEMINI_MODELS[session.current_model]['name']
-    
-    welcome_text = (
-        f"🤖 *Gemini Bot v2.0*\n\n"
-        f"Текущая модель: *{model_name}*\n\n"
-        "✨ *Возможности:*\n"
-        "• 💬 Умный чат с контекстом\n"
-        "• 🖼️ Анализ изображений\n"
-        "• 💻 Генерация кода\n"
-        "• 🎨 Создание картинок\n\n"
-        "📋 *Команды:*\n"
-        "/models - Выбрать модель\n"
-        "/clear - Очистить историю\n"
-        "/image - Создать картинку\n"
-        "/help - Справка\n\n"
-        "*Просто отправьте сообщение или фото!*"
+    await message.answer(
+        START_TEXTS[owner_session(message.chat, message.from_user.id).current_model], parse_mode=ParseMode.MARKDOWN
     )
-    
-    await message.answer(welcome_text, parse_mode=ParseMode.MARKDOWN)
 
 @router.message(Command("help"))
 async def cmd_help(message: Message):
-    help_text = (
-        "📖 *Помощь*\n\n"
-        "*Как использовать:*\n"
-        "1. Напишите любой вопрос\n"
-        "2. Отправьте фото для анализа\n"
-        "3. Используйте /image для генерации картинок\n\n"
-        "*Советы:*\n"
-        "• Используйте /models для смены модели\n"
-        "• Gemini 3.0 Flash - самая новая и мощная\n"
-        "• Imagen 3 - только для генерации изображений\n"
-        "• /clear если ответы стали странными\n\n"
-        "*Примеры запросов:*\n"
-        "• `Объясни теорию относительности`\n"
-        "• `Напиши код сайта на Python`\n"
-        "• `Что на этом фото?` (отправьте фото)\n"
-        "• `/image космический корабль в туманности`"
-    )
-    
-    await message.answer(help_text, parse_mode=ParseMode.MARKDOWN)
+    await message.answer(HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
 
 @router.message(Command("models"))
 async def cmd_models(message: Message):
-    user_id = message.from_user.id
-    
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
-    
-    session = user_sessions[user_id]
-    
-    # Создаем клавиатуру с категориями
-    keyboard = []
-    
-    # Текстовые модели
-    keyboard.append([InlineKeyboardButton(
-        text="💬 Текстовые модели",
-        callback_data="category_text"
-    )])
-    
-    # Изображения
-    keyboard.append([InlineKeyboardButton(
-        text="🎨 Генерация изображений",
-        callback_data="category_image"
-    )])
-    
-    # Текущая модель
-    current_model = GEMINI_MODELS[session.current_model]
-    current_text = f"📊 Текущая: {current_model['name']}"
-    
+    # В группе меню меняет модель чата, на которой отвечает бот
     await message.answer(
-        f"🤖 *Выбор модели*\n\n{current_text}\n\nВыберите категорию:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        MODELS_TEXTS[owner_session(message.chat, message.from_user.id).current_model],
+        reply_markup=MODELS_MARKUP,
         parse_mode=ParseMode.MARKDOWN
     )
 
+async def edit_menu(callback: CallbackQuery, text: str, markup: InlineKeyboardMarkup = None):
+    """Перерисовать меню на месте; повторное нажатие той же кнопки не ошибка"""
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
 @router.callback_query(F.data == "category_text")
 async def category_text(callback: CallbackQuery):
     """Показать текстовые модели"""
-    user_id = callback.from_user.id
-    session = user_sessions.get(user_id, UserSession(user_id))
-    
-    keyboard = []
-    
-    # Фильтруем текстовые модели
-    text_models = {k: v for k, v in GEMINI_MODELS.items() if v['category'] == 'text'}
-    
-    for model_id, model in text_models.items():
-        is_current = "✅ " if model_id == session.current_model else ""
-        button_text = f"{is_current}{model['name']}"
-        
-        keyboard.append([InlineKeyboardButton(
-            text=button_text,
-            callback_data=f"model_{model_id}"
-        )])
-    
-    # Кнопка назад
-    keyboard.append([InlineKeyboardButton(
-        text="🔙 Назад",
-        callback_data="models_back"
-    )])
-    
-    await callback.message.edit_text(
-        "💬 *Текстовые модели:*\n\n"
-        "• Gemini 1.5 Flash - ⚡ Баланс скорости и качества\n"
-        "• Gemini 1.5 Pro - 🎯 Для сложных задач\n"
-        "• Gemini 3.0 Flash - 🚀 Самая новая и мощная",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
-        parse_mode=ParseMode.MARKDOWN
-    )
+    await edit_menu(callback, TEXT_MODELS_TEXT, TEXT_MODELS_MARKUPS[current_model(callback.message.chat, callback.from_user.id)])
     await callback.answer()
 
 @router.callback_query(F.data == "category_image")
 async def category_image(callback: CallbackQuery):
     """Показать модели для генерации изображений"""
-    keyboard = []
-    
-    # Только Imagen 3
-    model = GEMINI_MODELS['imagen-3']
-    keyboard.append([InlineKeyboardButton(
-        text=f"🎨 {model['name']}",
-        callback_data="model_imagen-3"
-    )])
-    
-    # Кнопка назад
-    keyboard.append([InlineKeyboardButton(
-        text="🔙 Назад",
-        callback_data="models_back"
-    )])
-    
-    await callback.message.edit_text(
-        "🎨 *Генерация изображений:*\n\n"
-        f"*{model['name']}*\n"
-        f"{model['description']}\n\n"
-        "Для генерации используйте команду /image",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
-        parse_mode=ParseMode.MARKDOWN
-    )
+    await edit_menu(callback, IMAGE_MODELS_TEXT, IMAGE_MODELS_MARKUP)
     await callback.answer()
 
 @router.callback_query(F.data.startswith("model_"))
 async def model_selected(callback: CallbackQuery):
     """Обработка выбора модели"""
     model_id = callback.data.replace("model_", "")
-    user_id = callback.from_user.id
     
     if model_id not in GEMINI_MODELS:
         await callback.answer("❌ Неизвестная модель")
         return
     
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
-    
-    session = user_sessions[user_id]
+    session = owner_session(callback.message.chat, callback.from_user.id)
     session.current_model = model_id
     
-    model = GEMINI_MODELS[model_id]
-    
-    await callback.message.edit_text(
-        f"✅ *Модель выбрана!*\n\n"
-        f"🤖 *{model['name']}*\n"
-        f"📝 {model['description']}\n\n"
-        f"Теперь вы можете использовать {'текстовый чат' if model['category'] == 'text' else 'генерацию изображений'}",
-        parse_mode=ParseMode.MARKDOWN
-    )
-    await callback.answer(f"Установлена: {model['name']}")
+    await edit_menu(callback, SELECTED_TEXTS[model_id])
+    await callback.answer(f"Установлена: {GEMINI_MODELS[model_id]['name']}")
 
 @router.callback_query(F.data == "models_back")
 async def models_back(callback: CallbackQuery):
-    """Вернуться к выбору категорий"""
-    await cmd_models(callback.message)
+    """Вернуться к выбору категорий (в том же сообщении)"""
+    await edit_menu(callback, MODELS_TEXTS[current_model(callback.message.chat, callback.from_user.id)], MODELS_MARKUP)
     await callback.answer()
 
 @router.message(Command("clear"))
 async def cmd_clear(message: Message):
-    user_id = message.from_user.id
+    # В группе очищается общая история чата
+    sessions, user_id = session_owner(message.chat, message.from_user.id)
     
-    if user_id in user_sessions:
-        old_count = len(user_sessions[user_id].history)
-        user_sessions[user_id].history = []
+    if user_id in sessions:
+        old_count = len(sessions[user_id].history)
+        sessions[user_id].history = []
         
         if old_count > 0:
             await message.answer(f"🧹 Очищено {old_count} сообщений")
@@ -274,148 +151,285 @@ async def cmd_stats(message: Message):
         return
     
     model = GEMINI_MODELS[session.current_model]
+    reset_daily_usage(session)
+    budget_text = f" / {USAGE_DAILY_TOKENS_PER_USER}" if USAGE_DAILY_TOKENS_PER_USER else ""
     
     stats_text = (
         f"📊 *Статистика*\n\n"
         f"🤖 Модель: *{model['name']}*\n"
         f"💬 Сообщений: *{len(session.history)}/{MAX_HISTORY_MESSAGES}*\n"
         f"📈 Всего: *{session.message_count}*\n"
+        f"🔢 Токенов сегодня: *{session.daily_tokens}*{budget_text}\n"
+        f"🧮 Токенов всего: *{total_tokens(session)}*\n"
         f"🕐 Активность: *{session.last_activity.strftime('%H:%M %d.%m')}*"
     )
     
     await message.answer(stats_text, parse_mode=ParseMode.MARKDOWN)
 
+@router.message(Command("usage"))
+async def cmd_usage(message: Message):
+    """Отчет о расходе токенов (только для администраторов)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам")
+        return
+    
+    lines = ["📈 *Расход токенов*\n", "*По моделям (вход / выход):*"]
+    for model_id, entry in sorted(model_usage.items(), key=lambda i: i[1]['input'] + i[1]['output'], reverse=True):
+        lines.append(f"• `{model_id}`: {entry['input']} / {entry['output']}")
+    if not model_usage:
+        lines.append("• нет данных")
+    
+    lines.append("\n*Ключи Gemini (запросы / ошибки / 429):*")
+    for key in key_pool.report():
+        status = "✅" if key['available'] else f"⛔ {key['disabled_reason']}"
+        lines.append(f"• {key['key']}: {key['requests']} / {key['errors']} / {key['rate_limited']} {status}")
+    
+    lines.append(
+        f"\n*Группы:* {group_stats['messages']} сообщений, до Gemini {api_share():.0%} "
+        f"(ответ: {group_stats['reply']}, упоминание: {group_stats['mention']}, "
+        f"пропущено: {group_stats['not_addressed']} + {group_stats['no_text']} без текста)"
+    )
+    
+    inline = inline_debouncer.stats
+    lines.append(
+        f"*Inline:* {inline['queries']} запросов, вызовов Gemini {inline['gemini_calls']} "
+        f"(из кэша: {inline['cache_hits']}, вытеснено: {inline['superseded']})"
+    )
+    
+    lines.append("\n*Топ пользователей (сегодня / всего):*")
+    consumers = top_consumers()
+    for session in consumers:
+        lines.append(f"• `{session.user_id}`: {session.daily_tokens} / {total_tokens(session)}")
+    if not consumers:
+        lines.append("• нет данных")
+    
+    await message.answer("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
 @router.message(Command("image"))
 async def cmd_image(message: Message):
     """Команда для генерации изображений"""
     prompt = message.text.replace("/image", "").strip()
     
+    # Необязательное число вариантов: /image x3 описание
+    variants = 1
+    first, _, rest = prompt.partition(" ")
+    if len(first) > 1 and first[0] in "xх" and first[1:].isdigit():
+        variants = max(1, min(int(first[1:]), IMAGE_MAX_VARIANTS))
+        prompt = rest.strip()
+    
     if not prompt:
         await message.answer(
             "🎨 *Генерация изображений*\n\n"
-            "Использование: `/image описание`\n\n"
+            "Использование: `/image описание`\n"
+            f"Несколько вариантов: `/image x3 описание` (до {IMAGE_MAX_VARIANTS})\n\n"
             "*Примеры:*\n"
             "• `/image космический корабль`\n"
             "• `/image кот в костюме супергероя`\n"
-            "• `/image закат над горами в стиле аниме`",
+            "• `/image x2 закат над горами в стиле аниме`",
             parse_mode=ParseMode.MARKDOWN
         )
         return
     
-    await generate_image(message, prompt)
+    await generate_image(message, prompt, variants)
 
-# --- ГЕНЕРАЦИЯ ИЗОБРАЖЕНИЙ ---
-async def generate_image(message: Message, prompt: str):
-    """Генерация изображения через Imagen 3"""
-    user_id = message.from_user.id
-    
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
+@router.message(Command("cancel"))
+async def cmd_cancel(message: Message):
+    """Отменить все задачи генерации пользователя"""
+    jobs = image_queue.cancel_all(message.from_user.id)
+    for job in jobs:
+        if job.task is None:
+            await mark_job_cancelled(job)
+    
+    if jobs:
+        await message.answer(f"🚫 Отменено задач: {len(jobs)}")
+    else:
+        await message.answer("ℹ️ Нет активных задач генерации")
+
+@router.callback_query(F.data.startswith(CANCEL_PREFIX))
+async def image_job_cancel(callback: CallbackQuery):
+    """Кнопка отмены на сообщении со статусом задачи"""
+    job_id = callback.data.replace(CANCEL_PREFIX, "")
+    job = image_queue.cancel(int(job_id), callback.from_user.id) if job_id.isdigit() else None
+    
+    if job is None:
+        await callback.answer("Задача уже завершена")
+        return
     
-    session = user_sessions[user_id]
-    session.message_count += 1
-    session.last_activity = datetime.now()
+    # Задачи из очереди помечаем сразу, запущенные - помечает воркер
+    if job.task is None:
+        await mark_job_cancelled(job)
+    await callback.answer("Отменено")
+
+# --- ГЕНЕРАЦИЯ ИЗОБРАЖЕНИЙ ---
+async def generate_image(message: Message, prompt: str, variants: int = 1):
+    """Поставить генерацию в фоновую очередь и сразу ответить позицией"""
+    session = get_session(message.from_user.id)
+    touch(session)
     
     # Проверяем длину промпта
     if len(prompt) > 1000:
         await message.answer("⚠️ Промпт слишком длинный (макс 1000 символов)")
         return
     
-    await message.chat.do("upload_photo")
+    job = ImageJob(message, prompt, variants)
+    try:
+        position = await image_queue.submit(job)
+    except UserLimitReached:
+        await message.answer(
+            f"⚠️ У вас уже {IMAGE_JOBS_PER_USER} задачи в работе\n\n"
+            "Дождитесь результата или отмените их: /cancel"
+        )
+        return
+    except QueueFull:
+        await message.answer("⚠️ Очередь генерации переполнена, попробуйте позже")
+        return
     
     try:
-        # Используем Imagen 3
-        imagen_model = genai.GenerativeModel('imagen-3')
-        
-        response = await asyncio.to_thread(
-            imagen_model.generate_images,
-            prompt=prompt,
-            number_of_images=1,
-            language="ru"
+        job.status_message = await message.answer(
+            f"⏳ В очереди, позиция {position}",
+            reply_markup=job.cancel_markup()
         )
-        
-        if not response.images:
-            raise ValueError("API не вернул изображение")
-        
-        image_url = response.images[0]._image_url
-        img_response = requests.get(image_url, timeout=GEMINI_TIMEOUT)
-        img_response.raise_for_status()
-        
-        img_data = BytesIO(img_response.content)
-        
-        await message.answer_photo(
-            photo=img_data,
-            caption=f"🎨 *Создано по запросу:*\n{prompt}",
+    finally:
+        job.status_ready.set()
+
+async def mark_job_cancelled(job: ImageJob):
+    if job.status_message is None:
+        return
+    try:
+        await job.status_message.edit_text("🚫 Генерация отменена")
+    except Exception as e:
+        logger.debug("Не удалось обновить статус задачи %s: %s", job.id, e)
+
+async def reply_engine_error(message: Message, session: UserSession, error: EngineError):
+    """Сообщить пользователю, почему запрос не может быть выполнен"""
+    if isinstance(error, ImageModelSelected):
+        await message.answer(
+            "🎨 *Эта модель только для генерации изображений*\n\n"
+            "Используйте команду `/image описание`\n\n"
+            "Или выберите текстовую модель через /models",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    except Exception as e:
-        logger.error(f"Ошибка генерации изображения: {e}")
+    elif isinstance(error, VisionNotSupported):
+        model_config = GEMINI_MODELS[session.current_model]
         await message.answer(
-            "❌ *Не удалось создать изображение*\n\n"
-            "Попробуйте:\n"
-            "• Изменить описание\n"
-            "• Сделать запрос проще\n"
-            "• Попробовать позже"
+            "❌ *Модель не поддерживает анализ изображений*\n\n"
+            f"Текущая: *{model_config['name']}*\n\n"
+            "Используйте /models чтобы выбрать:\n"
+            "• Gemini 1.5 Flash/Pro\n"
+            "• Gemini 3.0 Flash",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    elif isinstance(error, BudgetExceeded):
+        await message.answer(
+            "⛔ *Дневной лимит токенов исчерпан*\n\n"
+            "Лимит обновится завтра",
+            parse_mode=ParseMode.MARKDOWN
         )
 
-# --- ОБРАБОТКА ТЕКСТА ---
-@router.message(F.text & ~F.command)
-async def handle_text(message: Message):
-    user_id = message.from_user.id
-    user_message = message.text
+# --- INLINE-РЕЖИМ ---
+@router.inline_query()
+async def handle_inline(inline_query: InlineQuery):
+    """
+    @bot вопрос в любом чате. Запросы приходят на каждое нажатие клавиши,
+    поэтому до Gemini доходит только последний - после паузы в наборе.
+    """
+    query = inline_query.query.strip()
+    if len(query) < INLINE_MIN_QUERY_LENGTH:
+        await inline_query.answer([], cache_time=0, is_personal=True)
+        return
     
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
+    user_id = inline_query.from_user.id
+    session = get_session(user_id)
     
-    session = user_sessions[user_id]
-    session.message_count += 1
-    session.last_activity = datetime.now()
+    try:
+        model_key = resolve_model(session)
+    except EngineError as e:
+        text = "⛔ Дневной лимит исчерпан" if isinstance(e, BudgetExceeded) else "🎨 Выберите текстовую модель"
+        await inline_query.answer(
+            [], cache_time=0, is_personal=True,
+            button=InlineQueryResultsButton(text=text, start_parameter="inline")
+        )
+        return
     
-    # Ограничиваем историю
-    if len(session.history) > MAX_HISTORY_MESSAGES:
-        keep = MAX_HISTORY_MESSAGES // 2
-        session.history = session.history[-keep:]
+    key = (model_key, normalize_query(query))
+    try:
+        response_text = await inline_debouncer.resolve(
+            user_id, key, lambda: complete(session, query, model_key, handler='inline')
+        )
+    except Exception as e:
+        logger.error("Ошибка inline-запроса: %s", e, extra={'user_id': user_id, 'model': model_key, 'handler': 'inline'})
+        return
+    
+    if response_text is None:
+        # Пользователь уже набрал новый запрос - отвечать на этот незачем
+        return
+    
+    result = InlineQueryResultArticle(
+        id=hashlib.md5(repr(key).encode()).hexdigest(),
+        title=query[:100],
+        description=response_text[:100],
+        input_message_content=InputTextMessageContent(
+            message_text=f"❓ {query}\n\n{response_text}"[:4096],
+            parse_mode=ParseMode.MARKDOWN
+        )
+    )
+    await inline_query.answer([result], cache_time=INLINE_CACHE_TTL_SECONDS, is_personal=True)
+
+# --- ГРУППОВЫЕ ЧАТЫ ---
+@router.message(F.chat.type.in_(GROUP_CHAT_TYPES))
+async def handle_group(message: Message):
+    """
+    Все некомандные сообщения групп. Бот отвечает только на ответы ему и
+    упоминания; остальное отсекается до создания сессии и вызова модели.
+    """
+    me = await message.bot.me()
+    reason = classify(message, me.id, me.username)
+    count(reason)
+    if reason not in ADDRESSED:
+        return
+    
+    # История общая для чата, а квота и учет токенов - автора сообщения
+    session = get_chat_session(message.chat.id)
+    billing = get_session(message.from_user.id)
+    touch(session)
+    touch(billing)
+    
+    try:
+        model_key = resolve_model(session, billing=billing)
+    except EngineError as e:
+        await reply_engine_error(message, session, e)
+        return
     
     await message.chat.do("typing")
     
     try:
-        model_config = GEMINI_MODELS[session.current_model]
-        
-        # Если выбрана Imagen 3 для текста - предлагаем использовать /image
-        if model_config['category'] == 'image':
-            await message.answer(
-                "🎨 *Эта модель только для генерации изображений*\n\n"
-                "Используйте команду `/image описание`\n\n"
-                "Или выберите текстовую модель через /models",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-        
-        # Добавляем в историю
-        session.history.append({"role": "user", "parts": [user_message]})
-        
-        # Создаем модель
-        model = genai.GenerativeModel(model_config['model_id'])
-        
-        # Генерируем ответ
-        if len(session.history) > 1:
-            chat = model.start_chat(history=session.history[:-1])
-            response = await asyncio.to_thread(chat.send_message, user_message)
-        else:
-            response = await asyncio.to_thread(model.generate_content, user_message)
-        
-        response_text = response.text
-        session.history.append({"role": "model", "parts": [response_text]})
+        response_text = await chat(session, group_prompt(message, me.username), model_key, handler='group', billing=billing)
+        await message.reply(response_text, parse_mode=ParseMode.MARKDOWN)
         
+    except Exception as e:
+        logger.error("Ошибка в группе: %s", e, extra={'user_id': message.from_user.id, 'model': model_key, 'handler': 'group'})
+        await message.reply("❌ Ошибка обработки, попробуйте переформулировать запрос")
+
+# --- ОБРАБОТКА ТЕКСТА ---
+@router.message(F.text & ~F.command)
+async def handle_text(message: Message):
+    session = get_session(message.from_user.id)
+    touch(session)
+    
+    try:
+        model_key = resolve_model(session)
+    except EngineError as e:
+        await reply_engine_error(message, session, e)
+        return
+    
+    await message.chat.do("typing")
+    
+    try:
+        response_text = await chat(session, message.text, model_key)
         await message.answer(response_text, parse_mode=ParseMode.MARKDOWN)
         
     except Exception as e:
-        logger.error(f"Ошибка текста: {e}")
-        
-        if session.history and session.history[-1]["role"] == "user":
-            session.history.pop()
-        
+        logger.error("Ошибка текста: %s", e, extra={'user_id': session.user_id, 'model': model_key, 'handler': 'text'})
         await message.answer(
             "❌ *Ошибка обработки*\n\n"
             "Попробуйте:\n"
@@ -425,55 +439,181 @@ async def handle_text(message: Message):
         )
 
 # --- ОБРАБОТКА ИЗОБРАЖЕНИЙ ---
+def load_image(img_bytes: BytesIO) -> Image.Image:
+    image = Image.open(img_bytes)
+    image.load()
+    return image
+
 @router.message(F.photo)
 async def handle_image(message: Message):
-    user_id = message.from_user.id
+    session = get_session(message.from_user.id)
+    touch(session)
     
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession(user_id)
+    try:
+        model_key = resolve_model(session, require_vision=True)
+    except EngineError as e:
+        await reply_engine_error(message, session, e)
+        return
     
-    session = user_sessions[user_id]
-    session.message_count += 1
-    session.last_activity = datetime.now()
+    await message.chat.do("upload_photo")
     
-    # Проверяем поддержку vision
-    model_config = GEMINI_MODELS[session.current_model]
-    if not model_config['supports_vision']:
+    try:
+        img_bytes = await message.bot.download(message.photo[-1])
+        # Разбор изображения - синхронный, выполняем вне event loop
+        image = await asyncio.to_thread(load_image, img_bytes)
+        
+        prompt = message.caption or "Опиши это изображение"
+        
+        response_text = await analyze(session, [prompt, image], f"[Изображение] {prompt}", model_key, 'photo')
+        await message.answer(response_text, parse_mode=ParseMode.MARKDOWN)
+        
+    except Exception as e:
+        logger.error("Ошибка анализа изображения: %s", e, extra={'user_id': session.user_id, 'model': model_key, 'handler': 'photo'})
+        await message.answer("❌ Не удалось проанализировать изображение")
+
+# --- ОБРАБОТКА ДОКУМЕНТОВ ---
+@router.message(F.document)
+async def handle_document(message: Message):
+    document = message.document
+    session = get_session(message.from_user.id)
+    touch(session)
+    
+    if document.file_size and document.file_size > DOCUMENT_MAX_SIZE_MB * 1024 * 1024:
+        await message.answer(f"⚠️ Файл слишком большой (макс {DOCUMENT_MAX_SIZE_MB} МБ)")
+        return
+    
+    mime_type = guess_mime_type(document.file_name, document.mime_type)
+    is_text = is_text_document(document.file_name, mime_type)
+    
+    if not is_text and not is_binary_supported(mime_type):
         await message.answer(
-            "❌ *Модель не поддерживает анализ изображений*\n\n"
-            f"Текущая: *{model_config['name']}*\n\n"
-            "Используйте /models чтобы выбрать:\n"
-            "• Gemini 1.5 Flash/Pro\n"
-            "• Gemini 3.0 Flash",
+            "❌ *Формат не поддерживается*\n\n"
+            "Можно отправить PDF, изображение или текстовый файл (код, логи, конфиги)",
             parse_mode=ParseMode.MARKDOWN
         )
         return
     
-    await message.chat.do("upload_photo")
+    try:
+        model_key = resolve_model(session, require_vision=not is_text)
+    except EngineError as e:
+        await reply_engine_error(message, session, e)
+        return
+    
+    await message.chat.do("typing")
+    
+    prompt = message.caption or "Проанализируй этот документ"
+    uploaded = None
+    api_key = None
+    truncated = False
     
     try:
-        photo = await message.photo[-1].get_file()
-        img_bytes = await photo.download_as_bytearray()
-        image = Image.open(BytesIO(img_bytes))
+        async with document_semaphore:
+            # Файл пишется в спул по частям, целиком в памяти не держится
+            with new_spool() as spool:
+                await message.bot.download(
+                    document,
+                    destination=spool,
+                    chunk_size=DOCUMENT_CHUNK_SIZE
+                )
+                
+                if is_text:
+                    chunks, tokens, truncated = await asyncio.to_thread(
+                        iter_text_chunks, spool, DOCUMENT_MAX_TOKENS
+                    )
+                    logger.debug("Документ %s: ~%d токенов, обрезан: %s", document.file_name, tokens, truncated)
+                    contents = [prompt, f"Файл: {document.file_name}", *chunks]
+                else:
+                    # Бинарные файлы уходят в Gemini File API, в запросе только ссылка
+                    # Файл доступен только ключу, которым загружен
+                    api_key = key_pool.acquire()
+                    uploaded = await upload_spool(spool, mime_type, document.file_name, api_key)
+                    contents = [prompt, uploaded]
         
-        prompt = message.caption or "Опиши это изображение"
+        response_text = await analyze(
+            session, contents, f"[Документ: {document.file_name}] {prompt}", model_key, 'document', api_key=api_key
+        )
         
-        session.history.append({"role": "user", "parts": [f"[Изображение] {prompt}"]})
+        if truncated:
+            response_text += f"\n\n⚠️ Документ обрезан до ~{DOCUMENT_MAX_TOKENS} токенов"
         
-        model = genai.GenerativeModel(model_config['model_id'])
-        response = await asyncio.to_thread(
-            model.generate_content,
-            [prompt, image]
-        )
+        await message.answer(response_text, parse_mode=ParseMode.MARKDOWN)
         
-        response_text = response.text
-        session.history.append({"role": "model", "parts": [response_text]})
+    except Exception as e:
+        logger.error("Ошибка обработки документа: %s", e, extra={'user_id': session.user_id, 'model': model_key, 'handler': 'document'})
+        await message.answer("❌ Не удалось обработать документ")
+    finally:
+        await delete_uploaded(uploaded, api_key)
+
+# --- ОБРАБОТКА ГОЛОСОВЫХ И АУДИО ---
+@router.message(F.voice | F.audio)
+async def handle_voice(message: Message):
+    is_voice = message.voice is not None
+    audio = message.voice or message.audio
+    session = get_session(message.from_user.id)
+    touch(session)
+    
+    max_duration = VOICE_MAX_DURATION_SECONDS if is_voice else AUDIO_MAX_DURATION_SECONDS
+    if audio.duration and audio.duration > max_duration:
+        await message.answer(f"⚠️ Запись слишком длинная (макс {max_duration} с)")
+        return
+    
+    if audio.file_size and audio.file_size > DOCUMENT_MAX_SIZE_MB * 1024 * 1024:
+        await message.answer(f"⚠️ Файл слишком большой (макс {DOCUMENT_MAX_SIZE_MB} МБ)")
+        return
+    
+    try:
+        model_key = resolve_model(session, require_vision=True)
+    except EngineError as e:
+        await reply_engine_error(message, session, e)
+        return
+    
+    # OGG/Opus и другие форматы Gemini принимает как есть - без ffmpeg и декодирования
+    if is_voice:
+        mime_type = audio.mime_type or 'audio/ogg'
+    else:
+        mime_type = guess_mime_type(audio.file_name, audio.mime_type)
+    
+    await message.chat.do("typing")
+    uploaded = None
+    api_key = None
+    
+    try:
+        async with document_semaphore:
+            with new_spool() as spool:
+                await message.bot.download(audio, destination=spool, chunk_size=DOCUMENT_CHUNK_SIZE)
+                api_key = key_pool.acquire()
+                uploaded = await upload_spool(spool, mime_type, getattr(audio, 'file_name', None) or 'voice.ogg', api_key)
         
+        response_text = await voice_reply(session, uploaded, model_key, message.caption, api_key=api_key)
         await message.answer(response_text, parse_mode=ParseMode.MARKDOWN)
         
     except Exception as e:
-        logger.error(f"Ошибка анализа изображения: {e}")
-        await message.answer("❌ Не удалось проанализировать изображение")
+        logger.error("Ошибка обработки аудио: %s", e, extra={'user_id': session.user_id, 'model': model_key, 'handler': 'voice'})
+        await message.answer("❌ Не удалось обработать голосовое сообщение")
+    finally:
+        await delete_uploaded(uploaded, api_key)
+
+# --- GEMINI FILE API ---
+async def upload_spool(spool, mime_type: str, display_name: str, api_key):
+    """Загрузить спул в Gemini File API; в запрос передается только ссылка на файл"""
+    try:
+        return await asyncio.to_thread(
+            api_key.file_client.create_file,
+            spool,
+            mime_type=mime_type,
+            display_name=display_name
+        )
+    except Exception as e:
+        key_pool.report_error(api_key, e)
+        raise
+
+async def delete_uploaded(uploaded, api_key):
+    if uploaded is None:
+        return
+    try:
+        await asyncio.to_thread(api_key.file_client.delete_file, name=uploaded.name)
+    except Exception as e:
+        logger.warning("Не удалось удалить файл %s: %s", uploaded.name, e)
 
 # --- РЕГИСТРАЦИЯ ---
 def register_gemini_handlers(dp):
@@ -0,0 +1,137 @@
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+
+from config import API_TOKEN, API_BATCH_MAX_PROMPTS
+from utils.gemini_engine import (
+    GEMINI_MODELS, EngineError, ImageModelSelected, VisionNotSupported, BudgetExceeded,
+    get_session, touch, resolve_model, chat, complete,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сессии HTTP-клиентов хранятся отдельно от пользователей Telegram
+API_SESSION_PREFIX = "api:"
+
+ERROR_STATUSES = {
+    ImageModelSelected: 400,
+    VisionNotSupported: 400,
+    BudgetExceeded: 429,
+}
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    """Проверка Bearer-токена для /api/*"""
+    if request.path.startswith("/api/"):
+        expected = f"Bearer {API_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            return web.json_response({"error": "unauthorized"}, status=401)
+    return await handler(request)
+
+
+async def run_prompt(item: dict) -> tuple[dict, int]:
+    """
+    Выполнить один запрос. С user_id - диалог с историей,
+    без него - одиночный запрос без контекста.
+    """
+    prompt = item.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        return {"error": "prompt_required"}, 400
+
+    model = item.get("model")
+    if model is not None and model not in GEMINI_MODELS:
+        return {"error": "unknown_model"}, 400
+
+    user_id = item.get("user_id")
+    session = get_session(f"{API_SESSION_PREFIX}{user_id if user_id is not None else 'anonymous'}")
+    touch(session)
+
+    try:
+        model_key = resolve_model(session, model_key=model)
+        if user_id is not None:
+            reply = await chat(session, prompt, model_key, handler='api')
+        else:
+            reply = await complete(session, prompt, model_key, handler='api')
+    except EngineError as e:
+        return {"error": type(e).__name__}, ERROR_STATUSES.get(type(e), 400)
+    except Exception as e:
+        logger.error("Ошибка HTTP API: %s", e, extra={'user_id': session.user_id, 'handler': 'api'})
+        return {"error": "gemini_error"}, 502
+
+    return {"reply": reply, "model": model_key}, 200
+
+
+async def _read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def api_chat(request):
+    """POST /api/chat {"prompt": "...", "user_id": "...", "model": "..."}"""
+    data = await _read_json(request)
+    if data is None:
+        return web.json_response({"error": "invalid_json"}, status=400)
+
+    result, status = await run_prompt(data)
+    return web.json_response(result, status=status)
+
+
+async def api_batch(request):
+    """
+    POST /api/batch {"prompts": ["...", ...], "model": "..."}
+    или {"requests": [{"prompt": "...", "user_id": "..."}, ...]}
+    Результаты возвращаются в том же порядке, каждый со своим статусом.
+    """
+    data = await _read_json(request)
+    if data is None:
+        return web.json_response({"error": "invalid_json"}, status=400)
+
+    items = data.get("requests")
+    if items is None:
+        # Строка или объект вместо списка иначе разобрались бы посимвольно / по ключам
+        prompts = data.get("prompts")
+        if not isinstance(prompts, list):
+            return web.json_response({"error": "prompts_required"}, status=400)
+        items = [{"prompt": prompt} for prompt in prompts]
+    if not isinstance(items, list) or not items:
+        return web.json_response({"error": "prompts_required"}, status=400)
+    if len(items) > API_BATCH_MAX_PROMPTS:
+        return web.json_response({"error": "batch_too_large", "max": API_BATCH_MAX_PROMPTS}, status=413)
+
+    # Общие параметры применяются к элементам, где они не заданы
+    defaults = {key: data[key] for key in ("model", "user_id") if key in data}
+    items = [{**defaults, **item} if isinstance(item, dict) else {} for item in items]
+
+    # Запросы одного user_id идут по очереди (общая история), остальные - параллельно;
+    # общая параллельность ограничена семафором движка
+    groups = {}
+    for index, item in enumerate(items):
+        user_id = item.get("user_id")
+        groups.setdefault(str(user_id) if user_id is not None else ("anonymous", index), []).append(index)
+
+    results = [None] * len(items)
+
+    async def run_group(indexes):
+        for index in indexes:
+            results[index] = await run_prompt(items[index])
+
+    await asyncio.gather(*(run_group(indexes) for indexes in groups.values()))
+    return web.json_response({
+        "results": [{**result, "status": status} for result, status in results]
+    })
+
+
+def register_api_routes(app: web.Application):
+    if not API_TOKEN:
+        logger.info("HTTP API выключен: API_TOKEN не задан")
+        return
+    app.middlewares.append(auth_middleware)
+    app.router.add_post('/api/chat', api_chat)
+    app.router.add_post('/api/batch', api_batch)
+    logger.info("✅ HTTP API зарегистрирован")
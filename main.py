@@ -1,44 +1,83 @@
 import asyncio
 import os
 import logging
-import sys
 import contextlib
 from datetime import datetime
 import aiohttp
 from aiohttp import web
-import google.generativeai as genai
 
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand, BotCommandScopeDefault
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 
-from config import TELEGRAM_TOKEN, LOG_FILE, LOG_LEVEL, ADMIN_IDS, validate_config, GEMINI_API_KEY
+from config import (
+    TELEGRAM_TOKEN, LOG_FILE, LOG_LEVEL, ADMIN_IDS, validate_config, CATCHUP_ENABLED,
+    LOG_FORMAT, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE, LOG_SAMPLED_LOGGERS,
+    TELEGRAM_GLOBAL_PER_SECOND, TELEGRAM_CHAT_PER_SECOND, TELEGRAM_GROUP_PER_MINUTE, TELEGRAM_SEND_MAX_RETRIES,
+    TELEGRAM_CONNECTION_LIMIT,
+)
 from utils.session_manager import user_sessions # Импорт из нового файла
+from utils.log_pipeline import setup_log_pipeline, log_stats
+from utils.send_scheduler import SendScheduler, send_stats
+from utils.catchup import catchup_stats
+from utils.loop_watchdog import start_watchdog, stop_watchdog, is_overloaded, lag_stats
+from utils.key_pool import key_pool
+from utils.gemini_transport import configure_gemini, warm_up, start_keepalive, stop_keepalive, transport_stats
 
 # --- НАСТРОЙКА ЛОГГИРОВАНИЯ ---
 def setup_logging():
-    if not os.path.exists('logs'): os.makedirs('logs')
-    logging.basicConfig(
+    # Запись в stdout/файл идет в отдельном потоке, корутины не блокируются
+    return setup_log_pipeline(
         level=LOG_LEVEL,
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-        handlers=[logging.StreamHandler(sys.stdout)]
+        log_file=LOG_FILE,
+        json_format=LOG_FORMAT == "json",
+        sample_rate=LOG_SAMPLE_RATE,
+        sampled_loggers=LOG_SAMPLED_LOGGERS,
+        queue_size=LOG_QUEUE_SIZE,
+        file_max_bytes=LOG_FILE_MAX_BYTES,
+        file_backup_count=LOG_FILE_BACKUP_COUNT,
     )
 
-setup_logging()
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
 # --- ИНИЦИАЛИЗАЦИЯ ---
-genai.configure(api_key=GEMINI_API_KEY)
-bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
+configure_gemini()
+# Все исходящие запросы идут через один пул соединений и планировщик лимитов
+bot_session = AiohttpSession(limit=TELEGRAM_CONNECTION_LIMIT)
+bot_session.middleware(SendScheduler(
+    global_per_second=TELEGRAM_GLOBAL_PER_SECOND,
+    chat_per_second=TELEGRAM_CHAT_PER_SECOND,
+    group_per_minute=TELEGRAM_GROUP_PER_MINUTE,
+    max_retries=TELEGRAM_SEND_MAX_RETRIES,
+))
+bot = Bot(token=TELEGRAM_TOKEN, session=bot_session, default=DefaultBotProperties(parse_mode='HTML'))
 dp = Dispatcher()
 
 # --- ВЕБ-СЕРВЕР (Для Render) ---
 async def health_check(request):
+    # Перегруженный инстанс (event loop не успевает) помечаем как неготовый
+    if is_overloaded():
+        return web.Response(text=f"OVERLOADED: loop lag {lag_stats['max_recent_ms']} ms", status=503)
     return web.Response(text="OK")
 
+async def metrics(request):
+    """Счетчики подсистем: отправка в Telegram, логи, догоняющая обработка, Gemini"""
+    return web.json_response({
+        'send': {**send_stats, 'delay_seconds': round(send_stats['delay_seconds'], 3)},
+        'log': log_stats,
+        'catchup': catchup_stats,
+        'transport': transport_stats,
+        'loop': lag_stats,
+    })
+
 async def start_web_server():
+    from handlers.http_api import register_api_routes
     app = web.Application()
     app.router.add_get('/', health_check)
+    app.router.add_get('/metrics', metrics)
+    register_api_routes(app)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', int(os.environ.get("PORT", 8080)))
@@ -50,16 +89,37 @@ async def on_startup(bot: Bot):
     # Важно: импорт хендлеров только здесь!
     from handlers.gemini_handlers import register_gemini_handlers
     register_gemini_handlers(dp)
+    
+    # Соединение с Gemini устанавливаем до первого запроса пользователя
+    await warm_up()
+    start_keepalive()
+    key_pool.start()
+    
+    from utils.image_jobs import image_queue
+    image_queue.start()
+    
+    # Обновления, пришедшие во время рестарта, обрабатываем до начала polling
+    if CATCHUP_ENABLED:
+        from utils.catchup import run_catchup
+        await run_catchup(bot, dp)
+    
     logger.info("✅ Бот готов к работе")
 
 async def main():
+    start_watchdog()
     web_runner = await start_web_server()
     dp.startup.register(on_startup)
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
+        await bot.delete_webhook(drop_pending_updates=not CATCHUP_ENABLED)
         await dp.start_polling(bot)
     finally:
+        from utils.image_jobs import image_queue
+        await image_queue.stop()
+        await stop_keepalive()
+        await key_pool.stop()
         await web_runner.cleanup()
+        await stop_watchdog()
+        log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
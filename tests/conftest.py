@@ -0,0 +1,54 @@
+import os
+import sys
+
+# config.py читает окружение при импорте
+os.environ.setdefault("TELEGRAM_TOKEN", "42:TEST")
+os.environ.setdefault("GEMINI_API_KEY", "test-key-0000")
+os.environ["GEMINI_TRANSPORT"] = "rest"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from google.generativeai import client as genai_client
+
+from tests.fakes import FakeTelegram, FakeGemini
+from utils.key_pool import key_pool
+from utils.session_manager import user_sessions
+
+
+@pytest.fixture
+async def fake_telegram():
+    fake = FakeTelegram()
+    await fake.server.start_server()
+    yield fake
+    await fake.server.close()
+
+
+@pytest.fixture
+async def fake_gemini(monkeypatch):
+    fake = FakeGemini()
+    await fake.server.start_server()
+    monkeypatch.setattr(genai_client, "GENAI_API_DISCOVERY_URL", f"{fake.base}/$discovery/rest")
+    # Клиенты всех ключей - на фейковый сервер
+    for key in key_pool.keys:
+        key._clients.configure(api_key=key.key, transport="rest", client_options={"api_endpoint": fake.base})
+        key.disabled_reason = None
+    yield fake
+    await fake.server.close()
+
+
+@pytest.fixture
+async def bot(fake_telegram):
+    session = AiohttpSession(api=TelegramAPIServer.from_base(fake_telegram.base))
+    bot = Bot(token=os.environ["TELEGRAM_TOKEN"], session=session)
+    yield bot
+    await session.close()
+
+
+@pytest.fixture(autouse=True)
+def clean_sessions():
+    user_sessions.clear()
+    yield
+    user_sessions.clear()
@@ -0,0 +1,166 @@
+"""
+Локальные фейковые серверы для тестов: Telegram Bot API (с раздачей файлов)
+и Gemini REST API (discovery, загрузка в File API, generateContent).
+"""
+import itertools
+import json
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeTelegram:
+    """Bot API: getFile, раздача файлов, sendMessage и sendChatAction"""
+
+    def __init__(self):
+        self.files = {}
+        self.calls = []
+        self.sent = []
+        self.downloads = []
+        self._ids = itertools.count(100)
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._file)
+        self.server = TestServer(app)
+
+    @property
+    def base(self) -> str:
+        return str(self.server.make_url('')).rstrip('/')
+
+    def add_file(self, file_id: str, content: bytes, path: str):
+        self.files[file_id] = (path, content)
+
+    async def _method(self, request):
+        method = request.match_info['method']
+        data = dict(await request.post())
+        self.calls.append(method)
+
+        if method == 'getFile':
+            path, content = self.files[data['file_id']]
+            result = {'file_id': data['file_id'], 'file_unique_id': data['file_id'], 'file_size': len(content), 'file_path': path}
+        elif method == 'sendMessage':
+            self.sent.append(data['text'])
+            result = {
+                'message_id': next(self._ids),
+                'date': int(time.time()),
+                'chat': {'id': int(data['chat_id']), 'type': 'private'},
+                'text': data['text'],
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _file(self, request):
+        path = request.match_info['path']
+        for file_path, content in self.files.values():
+            if file_path == path:
+                self.downloads.append(path)
+                return web.Response(body=content)
+        raise web.HTTPNotFound()
+
+
+class FakeGemini:
+    """Gemini REST: discovery-документ, загрузка файла, файлы и generateContent"""
+
+    def __init__(self):
+        self.uploads = {}
+        self.deleted = []
+        self.requests = []
+        self.reply_text = "🎤 привет\nЗдравствуйте!"
+        self.fail_generate = False
+        self._ids = itertools.count(1)
+        # Загрузки больших файлов идут одним запросом
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/$discovery/rest', self._discovery)
+        app.router.add_post('/upload/v1beta/files', self._upload_start)
+        app.router.add_put('/upload-session/{id}', self._upload_data)
+        app.router.add_get('/v1beta/files/{id}', self._get_file)
+        app.router.add_delete('/v1beta/files/{id}', self._delete_file)
+        app.router.add_post('/v1beta/models/{action}', self._model_action)
+        self.server = TestServer(app)
+
+    @property
+    def base(self) -> str:
+        return str(self.server.make_url('')).rstrip('/')
+
+    def _file_json(self, file_id: str) -> dict:
+        upload = self.uploads[file_id]
+        return {
+            'name': f'files/{file_id}',
+            'displayName': upload['display_name'],
+            'mimeType': upload['mime_type'],
+            'sizeBytes': str(len(upload['content'])),
+            'uri': f'{self.base}/v1beta/files/{file_id}',
+            'state': 2,
+        }
+
+    async def _discovery(self, request):
+        root = f'{self.base}/'
+        return web.json_response({
+            'kind': 'discovery#restDescription',
+            'discoveryVersion': 'v1',
+            'id': 'generativelanguage:v1beta',
+            'name': 'generativelanguage',
+            'version': 'v1beta',
+            'rootUrl': root,
+            'baseUrl': root,
+            'servicePath': '',
+            'batchPath': 'batch',
+            'parameters': {'key': {'type': 'string', 'location': 'query'}},
+            'schemas': {
+                'CreateFileRequest': {'id': 'CreateFileRequest', 'type': 'object', 'properties': {'file': {'type': 'object'}}},
+                'CreateFileResponse': {'id': 'CreateFileResponse', 'type': 'object', 'properties': {'file': {'type': 'object'}}},
+            },
+            'resources': {'media': {'methods': {'upload': {
+                'id': 'generativelanguage.media.upload',
+                'path': 'v1beta/files',
+                'flatPath': 'v1beta/files',
+                'httpMethod': 'POST',
+                'parameters': {},
+                'parameterOrder': [],
+                'request': {'$ref': 'CreateFileRequest'},
+                'response': {'$ref': 'CreateFileResponse'},
+                'supportsMediaUpload': True,
+                'mediaUpload': {'accept': ['*/*'], 'protocols': {
+                    'simple': {'multipart': True, 'path': '/upload/v1beta/files'},
+                    'resumable': {'multipart': True, 'path': '/upload/v1beta/files'},
+                }},
+            }}}},
+        })
+
+    async def _upload_start(self, request):
+        file_id = f'f{next(self._ids)}'
+        metadata = json.loads(await request.text() or '{}').get('file', {})
+        self.uploads[file_id] = {
+            'display_name': metadata.get('displayName'),
+            'mime_type': request.headers.get('X-Upload-Content-Type'),
+            'content': b'',
+        }
+        return web.Response(headers={'Location': f'{self.base}/upload-session/{file_id}'})
+
+    async def _upload_data(self, request):
+        file_id = request.match_info['id']
+        self.uploads[file_id]['content'] += await request.read()
+        return web.json_response({'file': self._file_json(file_id)})
+
+    async def _get_file(self, request):
+        return web.json_response(self._file_json(request.match_info['id']))
+
+    async def _delete_file(self, request):
+        self.deleted.append(request.match_info['id'])
+        return web.json_response({})
+
+    async def _model_action(self, request):
+        model, _, action = request.match_info['action'].partition(':')
+        body = await request.json()
+        self.requests.append({'model': model, 'action': action, 'body': body})
+
+        if action == 'countTokens':
+            return web.json_response({'totalTokens': 1})
+        if self.fail_generate:
+            return web.json_response({'error': {'code': 500, 'message': 'boom', 'status': 'INTERNAL'}}, status=500)
+        return web.json_response({
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': self.reply_text}]}, 'finishReason': 1, 'index': 0}],
+            'usageMetadata': {'promptTokenCount': 12, 'candidatesTokenCount': 4, 'totalTokenCount': 16},
+        })
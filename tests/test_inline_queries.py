@@ -0,0 +1,61 @@
+import asyncio
+
+from utils.inline_queries import InlineDebouncer
+
+USER_ID = 5
+DELAY = 0.05
+
+
+def recorder(calls):
+    """Фабрика вызова Gemini, запоминающая, какие запросы до него дошли"""
+    def factory(query):
+        async def call():
+            calls.append(query)
+            return f"ответ на {query}"
+        return call
+    return factory
+
+
+async def test_only_query_after_pause_reaches_gemini():
+    debouncer = InlineDebouncer(DELAY, ttl=60, max_size=10)
+    calls = []
+    call = recorder(calls)
+
+    first = asyncio.create_task(debouncer.resolve(USER_ID, "a", call("a")))
+    await asyncio.sleep(DELAY / 5)
+    second = asyncio.create_task(debouncer.resolve(USER_ID, "ab", call("ab")))
+
+    assert await first is None
+    assert await second == "ответ на ab"
+    assert calls == ["ab"]
+    assert debouncer.stats['superseded'] == 1
+
+
+async def test_cached_query_supersedes_pending_one():
+    debouncer = InlineDebouncer(DELAY, ttl=60, max_size=10)
+    calls = []
+    call = recorder(calls)
+    assert await debouncer.resolve(USER_ID, "ab", call("ab")) == "ответ на ab"
+
+    # Пользователь набрал "abc" и стер последнюю букву до конца паузы
+    pending = asyncio.create_task(debouncer.resolve(USER_ID, "abc", call("abc")))
+    await asyncio.sleep(DELAY / 5)
+    assert await debouncer.resolve(USER_ID, "ab", call("ab")) == "ответ на ab"
+
+    assert await pending is None
+    await asyncio.sleep(DELAY * 2)
+    assert calls == ["ab"]
+    assert debouncer.stats == {'queries': 3, 'superseded': 1, 'cache_hits': 1, 'gemini_calls': 1}
+
+
+async def test_other_users_are_not_superseded():
+    debouncer = InlineDebouncer(DELAY, ttl=60, max_size=10)
+    calls = []
+    call = recorder(calls)
+
+    first = asyncio.create_task(debouncer.resolve(1, "a", call("a")))
+    second = asyncio.create_task(debouncer.resolve(2, "b", call("b")))
+
+    assert await first == "ответ на a"
+    assert await second == "ответ на b"
+    assert sorted(calls) == ["a", "b"]
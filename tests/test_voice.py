@@ -0,0 +1,121 @@
+import time
+
+from aiogram.types import Message
+
+from config import VOICE_MAX_DURATION_SECONDS, AUDIO_MAX_DURATION_SECONDS, DOCUMENT_MAX_SIZE_MB
+from handlers.gemini_handlers import handle_voice
+from utils.gemini_engine import get_session
+
+OGG = b"OggS" + bytes(range(256)) * 64
+USER_ID = 5
+
+
+def voice_message(bot, fake_telegram, content=OGG, duration=3, file_size=None, audio=False):
+    fake_telegram.add_file("v1", content, "voice/file_1.oga")
+    media = {
+        "file_id": "v1",
+        "file_unique_id": "u1",
+        "duration": duration,
+        "mime_type": "audio/mpeg" if audio else "audio/ogg",
+        "file_size": len(content) if file_size is None else file_size,
+    }
+    if audio:
+        media["file_name"] = "song.mp3"
+    return Message.model_validate({
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Ann"},
+        "audio" if audio else "voice": media,
+    }, context={"bot": bot})
+
+
+def file_parts(request):
+    return [
+        part
+        for content in request["body"]["contents"]
+        for part in content["parts"]
+        if "fileData" in part or "inlineData" in part
+    ]
+
+
+async def test_voice_goes_to_gemini_by_file_reference(bot, fake_telegram, fake_gemini):
+    await handle_voice(voice_message(bot, fake_telegram))
+
+    # Файл скачан с сервера Telegram и загружен в File API без изменений
+    assert fake_telegram.downloads == ["voice/file_1.oga"]
+    [upload] = fake_gemini.uploads.values()
+    assert upload["content"] == OGG
+    assert upload["mime_type"] == "audio/ogg"
+
+    # В запросе только ссылка на файл, байты аудио не встраиваются
+    [request] = [r for r in fake_gemini.requests if r["action"] == "generateContent"]
+    [part] = file_parts(request)
+    assert part["fileData"]["fileUri"].endswith("/v1beta/files/f1")
+    assert part["fileData"]["mimeType"] == "audio/ogg"
+
+    assert fake_telegram.sent == [fake_gemini.reply_text]
+    assert fake_gemini.deleted == ["f1"]
+
+
+async def test_transcript_lands_in_history(bot, fake_telegram, fake_gemini):
+    await handle_voice(voice_message(bot, fake_telegram))
+
+    history = get_session(USER_ID).history
+    assert history == [
+        {"role": "user", "parts": ["привет"]},
+        {"role": "model", "parts": ["Здравствуйте!"]},
+    ]
+
+
+async def test_history_is_sent_with_next_voice(bot, fake_telegram, fake_gemini):
+    session = get_session(USER_ID)
+    session.history = [
+        {"role": "user", "parts": ["как дела?"]},
+        {"role": "model", "parts": ["хорошо"]},
+    ]
+
+    await handle_voice(voice_message(bot, fake_telegram))
+
+    [request] = [r for r in fake_gemini.requests if r["action"] == "generateContent"]
+    texts = [part.get("text") for content in request["body"]["contents"] for part in content["parts"]]
+    assert texts[:2] == ["как дела?", "хорошо"]
+
+
+async def test_voice_over_duration_limit_is_rejected(bot, fake_telegram, fake_gemini):
+    await handle_voice(voice_message(bot, fake_telegram, duration=VOICE_MAX_DURATION_SECONDS + 1))
+
+    assert fake_telegram.sent == [f"⚠️ Запись слишком длинная (макс {VOICE_MAX_DURATION_SECONDS} с)"]
+    assert "getFile" not in fake_telegram.calls
+    assert not fake_gemini.uploads and not fake_gemini.requests
+
+
+async def test_audio_uses_its_own_duration_limit(bot, fake_telegram, fake_gemini):
+    duration = VOICE_MAX_DURATION_SECONDS + 1
+    assert duration <= AUDIO_MAX_DURATION_SECONDS
+
+    await handle_voice(voice_message(bot, fake_telegram, duration=duration, audio=True))
+
+    [upload] = fake_gemini.uploads.values()
+    assert upload["mime_type"] == "audio/mpeg"
+    assert upload["display_name"] == "song.mp3"
+    assert fake_telegram.sent == [fake_gemini.reply_text]
+
+
+async def test_voice_over_size_limit_is_rejected(bot, fake_telegram, fake_gemini):
+    size = DOCUMENT_MAX_SIZE_MB * 1024 * 1024 + 1
+    await handle_voice(voice_message(bot, fake_telegram, file_size=size))
+
+    assert fake_telegram.sent == [f"⚠️ Файл слишком большой (макс {DOCUMENT_MAX_SIZE_MB} МБ)"]
+    assert "getFile" not in fake_telegram.calls
+    assert not fake_gemini.uploads
+
+
+async def test_uploaded_file_is_deleted_when_gemini_fails(bot, fake_telegram, fake_gemini):
+    fake_gemini.fail_generate = True
+
+    await handle_voice(voice_message(bot, fake_telegram))
+
+    assert fake_telegram.sent == ["❌ Не удалось обработать голосовое сообщение"]
+    assert fake_gemini.deleted == ["f1"]
+    assert get_session(USER_ID).history == []
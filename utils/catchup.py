@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import CATCHUP_MAX_AGE_SECONDS, CATCHUP_CONCURRENCY, CATCHUP_MAX_UPDATES
+from utils.group_chat import GROUP_CHAT_TYPES, ADDRESSED, classify
+
+logger = logging.getLogger(__name__)
+
+STALE_NOTICE = (
+    "⏳ Бот был недоступен, и ваше сообщение устарело.\n"
+    "Пожалуйста, отправьте его ещё раз."
+)
+
+# Статистика последнего прогона (для логов и health-check)
+catchup_stats = {
+    'fetched': 0,
+    'processed': 0,
+    'collapsed': 0,
+    'stale': 0,
+    'failed': 0,
+    'drain_seconds': 0.0,
+    'throughput': 0.0,
+}
+
+
+async def fetch_batch(bot: Bot, offset: int = None, limit: int = 100) -> list[Update]:
+    """
+    Следующая пачка обновлений. Запрос с offset подтверждает все обновления
+    до него, поэтому offset сдвигается только после обработки пачки.
+    """
+    return await bot.get_updates(offset=offset, limit=limit, timeout=0)
+
+
+def _user_key(update: Update):
+    """Ключ для группировки обновлений одного пользователя"""
+    event = update.message or update.callback_query
+    if event is None:
+        return None
+    if event.from_user:
+        return event.from_user.id
+    return update.message.chat.id if update.message else None
+
+
+def _is_command(update: Update) -> bool:
+    message = update.message
+    return bool(message and message.text and message.text.startswith('/'))
+
+
+def _is_plain_text(update: Update) -> bool:
+    message = update.message
+    return bool(message and message.text and not message.text.startswith('/'))
+
+
+def _addressed_to_bot(message, bot_id: int, bot_username: str) -> bool:
+    """В группе об устаревшем сообщении стоит сообщать, только если оно было боту"""
+    if message.chat.type not in GROUP_CHAT_TYPES:
+        return True
+    if message.text and message.text.startswith('/'):
+        return True
+    return classify(message, bot_id, bot_username) in ADDRESSED
+
+
+def split_stale(updates: list[Update], bot_id: int = None, bot_username: str = None, now: datetime = None):
+    """
+    Отделить слишком старые сообщения и inline-запросы. Возвращает (свежие, чаты для уведомления).
+    Устаревшие групповые сообщения, не адресованные боту, отбрасываются молча.
+    """
+    now = now or datetime.now(timezone.utc)
+    fresh = []
+    stale_chats = set()
+
+    for update in updates:
+        # Inline-запросы после простоя никто не ждет, отвечать на них поздно
+        if update.inline_query:
+            continue
+        message = update.message
+        if message and (now - message.date).total_seconds() > CATCHUP_MAX_AGE_SECONDS:
+            if _addressed_to_bot(message, bot_id, bot_username):
+                stale_chats.add(message.chat.id)
+            continue
+        fresh.append(update)
+
+    return fresh, stale_chats
+
+
+def collapse_updates(updates: list[Update]):
+    """
+    Схлопнуть дубликаты и серии текстовых сообщений одного пользователя.
+    Повторяющиеся команды отбрасываются, подряд идущие тексты склеиваются
+    в одно сообщение на месте последнего из них.
+    Возвращает (команды, остальные обновления, число схлопнутых).
+    """
+    commands = []
+    others = []
+    collapsed = 0
+    seen_commands = set()
+    texts = defaultdict(list)
+    last_text_index = {}
+
+    for update in updates:
+        if _is_command(update):
+            key = (update.message.chat.id, _user_key(update), update.message.text.strip())
+            if key in seen_commands:
+                collapsed += 1
+                continue
+            seen_commands.add(key)
+            commands.append(update)
+        elif _is_plain_text(update):
+            key = (update.message.chat.id, _user_key(update))
+            if texts[key]:
+                collapsed += 1
+                others[last_text_index[key]] = None
+            texts[key].append(update)
+            last_text_index[key] = len(others)
+            others.append(update)
+        else:
+            others.append(update)
+
+    for key, index in last_text_index.items():
+        series = texts[key]
+        if len(series) == 1:
+            continue
+        parts = []
+        for update in series:
+            text = update.message.text.strip()
+            if text not in parts:
+                parts.append(text)
+        last = series[-1]
+        merged = last.message.model_copy(update={'text': "\n".join(parts)})
+        others[index] = last.model_copy(update={'message': merged})
+
+    return commands, [u for u in others if u is not None], collapsed
+
+
+async def _drain(bot: Bot, dp: Dispatcher, updates: list[Update], semaphore: asyncio.Semaphore):
+    """Обработать обновления: по очереди для одного пользователя, параллельно для разных"""
+    groups = defaultdict(list)
+    for update in updates:
+        groups[_user_key(update)].append(update)
+
+    async def process_group(group):
+        async with semaphore:
+            for update in group:
+                try:
+                    await dp.feed_update(bot, update)
+                    catchup_stats['processed'] += 1
+                except Exception as e:
+                    catchup_stats['failed'] += 1
+                    logger.error("Ошибка догоняющей обработки update %s: %s", update.update_id, e)
+
+    await asyncio.gather(*(process_group(group) for group in groups.values()))
+
+
+async def _notify_stale(bot: Bot, chat_id: int, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        try:
+            await bot.send_message(chat_id, STALE_NOTICE)
+        except Exception as e:
+            logger.warning("Не удалось уведомить чат %s: %s", chat_id, e)
+
+
+async def _process_batch(bot: Bot, dp: Dispatcher, updates: list[Update], semaphore: asyncio.Semaphore):
+    me = await bot.me()
+    fresh, stale_chats = split_stale(updates, me.id, me.username)
+    commands, others, collapsed = collapse_updates(fresh)
+    catchup_stats['stale'] += len(updates) - len(fresh)
+    catchup_stats['collapsed'] += collapsed
+
+    await asyncio.gather(*(_notify_stale(bot, chat_id, semaphore) for chat_id in stale_chats))
+
+    # Сначала команды, затем обычные сообщения
+    await _drain(bot, dp, commands, semaphore)
+    await _drain(bot, dp, others, semaphore)
+
+
+async def run_catchup(bot: Bot, dp: Dispatcher) -> dict:
+    """
+    Догнать очередь обновлений, накопившихся пока бот был недоступен.
+    Пачки подтверждаются по одной после обработки: при падении теряется
+    не больше одной пачки в работе, остальные Telegram отдаст повторно.
+    """
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(CATCHUP_CONCURRENCY)
+    offset = None
+
+    while catchup_stats['fetched'] < CATCHUP_MAX_UPDATES:
+        updates = await fetch_batch(bot, offset, limit=min(100, CATCHUP_MAX_UPDATES - catchup_stats['fetched']))
+        if not updates:
+            break
+        catchup_stats['fetched'] += len(updates)
+        await _process_batch(bot, dp, updates, semaphore)
+        offset = updates[-1].update_id + 1
+
+    if offset is None:
+        logger.info("📭 Пропущенных обновлений нет")
+        return catchup_stats
+
+    # Подтверждаем последнюю пачку, чтобы polling не получил ее повторно
+    await bot.get_updates(offset=offset, limit=1, timeout=0)
+
+    drain_seconds = time.monotonic() - started
+    catchup_stats['drain_seconds'] = round(drain_seconds, 3)
+    catchup_stats['throughput'] = round(catchup_stats['processed'] / drain_seconds, 2) if drain_seconds else 0.0
+
+    logger.info(
+        "📬 Догоняющая обработка: получено %d, обработано %d, схлопнуто %d, "
+        "устарело %d, ошибок %d, %.3f с (%.2f upd/с)",
+        catchup_stats['fetched'], catchup_stats['processed'], catchup_stats['collapsed'],
+        catchup_stats['stale'], catchup_stats['failed'],
+        catchup_stats['drain_seconds'], catchup_stats['throughput']
+    )
+    return catchup_stats
@@ -0,0 +1,91 @@
+import codecs
+import mimetypes
+import os
+import tempfile
+
+from config import DOCUMENT_SPOOL_MAX_BYTES, DOCUMENT_CHUNK_SIZE
+
+# Форматы, которые читаем как текст и отправляем в Gemini кусками
+TEXT_EXTENSIONS = {
+    '.txt', '.log', '.md', '.csv', '.tsv', '.json', '.xml', '.yaml', '.yml',
+    '.ini', '.toml', '.cfg', '.html', '.css', '.py', '.js', '.ts', '.java',
+    '.c', '.h', '.cpp', '.hpp', '.cs', '.go', '.rs', '.rb', '.php', '.sh', '.sql',
+}
+TEXT_MIME_TYPES = {
+    'application/json', 'application/xml', 'application/x-yaml',
+    'application/javascript', 'application/x-sh', 'application/sql',
+}
+# Бинарные форматы, которые Gemini принимает через File API
+BINARY_MIME_TYPES = {
+    'application/pdf', 'image/png', 'image/jpeg', 'image/webp',
+    'image/heic', 'image/heif',
+}
+
+# Грубая оценка: ~4 символа на токен
+CHARS_PER_TOKEN = 4
+
+
+def guess_mime_type(file_name: str | None, mime_type: str | None) -> str:
+    """Определить MIME-тип документа по данным Telegram или расширению"""
+    if mime_type:
+        return mime_type
+    if file_name:
+        guessed, _ = mimetypes.guess_type(file_name)
+        if guessed:
+            return guessed
+    return 'application/octet-stream'
+
+
+def is_text_document(file_name: str | None, mime_type: str) -> bool:
+    """Текстовый ли документ (код, логи, конфиги)"""
+    if mime_type.startswith('text/') or mime_type in TEXT_MIME_TYPES:
+        return True
+    ext = os.path.splitext(file_name or '')[1].lower()
+    return ext in TEXT_EXTENSIONS
+
+
+def is_binary_supported(mime_type: str) -> bool:
+    """Поддерживается ли бинарный формат в Gemini File API"""
+    return mime_type in BINARY_MIME_TYPES
+
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая локальная оценка количества токенов"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def new_spool():
+    """Временный файл: в памяти до DOCUMENT_SPOOL_MAX_BYTES, затем на диске"""
+    return tempfile.SpooledTemporaryFile(max_size=DOCUMENT_SPOOL_MAX_BYTES, mode='w+b')
+
+
+def iter_text_chunks(spool, max_tokens: int, chunk_size: int = DOCUMENT_CHUNK_SIZE):
+    """
+    Читать спул кусками и декодировать в текст, считая токены по ходу.
+    Возвращает (chunks, tokens, truncated). Чтение прекращается, как только
+    исчерпан бюджет токенов, поэтому в памяти не больше max_tokens текста.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    chunks = []
+    tokens = 0
+    truncated = False
+
+    spool.seek(0)
+    while True:
+        raw = spool.read(chunk_size)
+        text = decoder.decode(raw, final=not raw)
+        if text:
+            chunk_tokens = estimate_tokens(text)
+            if tokens + chunk_tokens > max_tokens:
+                remaining = max(max_tokens - tokens, 0) * CHARS_PER_TOKEN
+                if remaining:
+                    chunks.append(text[:remaining])
+                    tokens += estimate_tokens(text[:remaining])
+                truncated = True
+                break
+            chunks.append(text)
+            tokens += chunk_tokens
+        if not raw:
+            break
+
+    return chunks, tokens, truncated
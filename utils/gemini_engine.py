@@ -0,0 +1,252 @@
+"""
+Движок диалога: модели, история, квоты и вызовы Gemini.
+Не зависит от транспорта - используется Telegram-хэндлерами и HTTP API.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from config import GEMINI_MAX_CONCURRENCY
+from utils.session_manager import user_sessions, UserSession
+from utils.usage import admit_model, record_usage
+from utils.gemini_transport import mark_used
+from utils.key_pool import key_pool
+
+logger = logging.getLogger(__name__)
+
+# --- ДОСТУПНЫЕ МОДЕЛИ GEMINI ---
+GEMINI_MODELS = {
+    'gemini-1.5-flash': {
+        'name': 'Gemini 1.5 Flash',
+        'model_id': 'gemini-1.5-flash',
+        'description': '⚡ Быстрая и умная модель для любых задач',
+        'supports_vision': True,
+        'supports_image_gen': False,
+        'max_tokens': 8192,
+        'category': 'text'
+    },
+    'gemini-1.5-pro': {
+        'name': 'Gemini 1.5 Pro',
+        'model_id': 'gemini-1.5-pro',
+        'description': '🎯 Продвинутая модель для сложных запросов',
+        'supports_vision': True,
+        'supports_image_gen': False,
+        'max_tokens': 8192,
+        'category': 'text'
+    },
+    'gemini-2.0-flash-exp': {
+        'name': 'Gemini 2.0 Flash',
+        'model_id': 'gemini-2.0-flash-exp',
+        'description': '🚀 Экспериментальная модель 2.0',
+        'supports_vision': True,
+        'supports_image_gen': False,
+        'max_tokens': 8192,
+        'category': 'text'
+    },
+    'gemini-3.0-flash': {
+        'name': 'Gemini 3.0 Flash',
+        'model_id': 'gemini-3.0-flash',
+        'description': '🌟 Самая новая и мощная модель',
+        'supports_vision': True,
+        'supports_image_gen': False,
+        'max_tokens': 8192,
+        'category': 'text'
+    },
+    'imagen-3': {
+        'name': 'Imagen 3',
+        'model_id': 'imagen-3',
+        'description': '🎨 Генерация изображений по описанию',
+        'supports_vision': False,
+        'supports_image_gen': True,
+        'max_tokens': 2048,
+        'category': 'image'
+    }
+}
+
+# Общий лимит одновременных запросов к Gemini для всех транспортов
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+# --- ОШИБКИ ---
+class EngineError(Exception):
+    """Запрос не может быть выполнен (ошибка уровня пользователя, а не API)"""
+
+
+class ImageModelSelected(EngineError):
+    """Выбрана модель генерации изображений, а запрос текстовый"""
+
+
+class VisionNotSupported(EngineError):
+    """Модель не поддерживает анализ изображений и файлов"""
+
+
+class BudgetExceeded(EngineError):
+    """Дневной лимит токенов исчерпан"""
+
+
+# --- СЕССИИ ---
+def get_session(user_id) -> UserSession:
+    """Получить или создать сессию пользователя"""
+    if user_id not in user_sessions:
+        user_sessions[user_id] = UserSession(user_id)
+    return user_sessions[user_id]
+
+
+def touch(session: UserSession):
+    """Отметить новое сообщение пользователя"""
+    session.message_count += 1
+    session.last_activity = datetime.now()
+
+
+def trim_history(session: UserSession):
+    """Ограничить историю диалога"""
+    if len(session.history) > session.max_history:
+        keep = session.max_history // 2
+        session.history = session.history[-keep:]
+
+
+def resolve_model(session: UserSession, require_vision: bool = False, model_key: str = None, billing: UserSession = None) -> str:
+    """
+    Выбрать модель для запроса с учетом категории, vision и дневной квоты.
+    billing - сессия, чья квота расходуется, если не совпадает с session
+    (в группе история общая, а токены списываются с автора сообщения).
+    Бросает EngineError, если запрос выполнить нельзя.
+    """
+    billing = billing or session
+    model_key = model_key or session.current_model
+    model_config = GEMINI_MODELS[model_key]
+
+    if model_config['category'] == 'image':
+        raise ImageModelSelected(model_key)
+    if require_vision and not model_config['supports_vision']:
+        raise VisionNotSupported(model_key)
+
+    admitted = admit_model(billing, model_key)
+    if admitted is None:
+        raise BudgetExceeded(billing.user_id)
+    if admitted not in GEMINI_MODELS:
+        return model_key
+    return admitted
+
+
+# --- ВЫЗОВЫ GEMINI ---
+def log_gemini_call(user_id, model: str, handler: str, started: float):
+    """Записать задержку вызова Gemini (INFO, сэмплируется пайплайном логов)"""
+    logger.info(
+        "Ответ Gemini получен",
+        extra={
+            'user_id': user_id,
+            'model': model,
+            'handler': handler,
+            'latency_ms': round((time.monotonic() - started) * 1000),
+            'sample': True,
+        }
+    )
+
+
+async def generate(session: UserSession, model_key: str, contents, handler: str, history: list = None, api_key=None,
+                   billing: UserSession = None):
+    """
+    Вызвать Gemini (с историей или без) и учесть токены в billing (по умолчанию session).
+    api_key передается, когда в contents есть файлы, загруженные этим ключом.
+    """
+    billing = billing or session
+    model_id = GEMINI_MODELS[model_key]['model_id']
+
+    def send(key):
+        model = key.model(model_id)
+        if history:
+            return model.start_chat(history=history).send_message(contents)
+        return model.generate_content(contents)
+
+    async with gemini_semaphore:
+        started = time.monotonic()
+        response = await key_pool.call(send, api_key)
+        log_gemini_call(billing.user_id, model_key, handler, started)
+        mark_used()
+
+    record_usage(billing, model_key, response)
+    return response
+
+
+async def chat(session: UserSession, text: str, model_key: str = None, handler: str = 'text',
+               billing: UserSession = None) -> str:
+    """Ответить на текстовое сообщение с учетом истории диалога"""
+    model_key = model_key or resolve_model(session, billing=billing)
+    trim_history(session)
+
+    session.history.append({"role": "user", "parts": [text]})
+    try:
+        response = await generate(session, model_key, text, handler, history=session.history[:-1], billing=billing)
+        response_text = response.text
+    except Exception:
+        if session.history and session.history[-1]["role"] == "user":
+            session.history.pop()
+        raise
+
+    session.history.append({"role": "model", "parts": [response_text]})
+    return response_text
+
+
+async def complete(session: UserSession, text: str, model_key: str = None, handler: str = 'api') -> str:
+    """Одиночный запрос без истории диалога"""
+    model_key = model_key or resolve_model(session)
+    response = await generate(session, model_key, text, handler)
+    return response.text
+
+
+async def analyze(session: UserSession, contents: list, history_text: str, model_key: str, handler: str, api_key=None) -> str:
+    """
+    Одиночный мультимодальный запрос (фото, документ). В историю попадает
+    только текстовая пометка о запросе и ответ.
+    """
+    response = await generate(session, model_key, contents, handler, api_key=api_key)
+    response_text = response.text
+
+    session.history.append({"role": "user", "parts": [history_text]})
+    session.history.append({"role": "model", "parts": [response_text]})
+    return response_text
+
+
+VOICE_PROMPT = (
+    "Это голосовое сообщение пользователя. В первой строке запиши его расшифровку "
+    "в формате «🎤 текст», затем с новой строки ответь на него."
+)
+
+
+def split_transcript(text: str):
+    """Отделить строку расшифровки «🎤 ...» от ответа"""
+    first, _, rest = text.partition("\n")
+    if first.startswith("🎤") and rest.strip():
+        return first.removeprefix("🎤").strip(" «»"), rest.strip()
+    return None, text
+
+
+async def voice_reply(session: UserSession, audio_file, model_key: str, caption: str = None, api_key=None) -> str:
+    """
+    Ответить на голосовое или аудио с учетом истории. Файл передается
+    в Gemini как есть (без декодирования), в историю попадает расшифровка.
+    """
+    trim_history(session)
+    prompt = f"{VOICE_PROMPT}\nПодпись пользователя: {caption}" if caption else VOICE_PROMPT
+
+    response = await generate(
+        session, model_key, [prompt, audio_file], 'voice', history=list(session.history), api_key=api_key
+    )
+    response_text = response.text
+
+    transcript, reply = split_transcript(response_text)
+    session.history.append({"role": "user", "parts": [transcript or "[Голосовое сообщение]"]})
+    session.history.append({"role": "model", "parts": [reply]})
+    return response_text
+
+
+async def generate_images(prompt: str, number_of_images: int = 1):
+    """Сгенерировать изображения через Imagen 3"""
+    def send(key):
+        imagen_model = key.model(GEMINI_MODELS['imagen-3']['model_id'])
+        return imagen_model.generate_images(prompt=prompt, number_of_images=number_of_images, language="ru")
+
+    async with gemini_semaphore:
+        return await key_pool.call(send)
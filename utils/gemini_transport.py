@@ -0,0 +1,100 @@
+"""
+Управление соединением с Gemini: выбор транспорта, прогрев при старте
+и дешевые пинги в простое, чтобы первый запрос пользователя не платил
+за DNS, TLS и установку канала.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+
+import google.generativeai as genai
+
+from config import GEMINI_API_KEY, GEMINI_TRANSPORT, GEMINI_KEEPALIVE_SECONDS, DEFAULT_MODEL
+from utils.key_pool import key_pool
+
+logger = logging.getLogger(__name__)
+
+# Состояние соединения (для логов и health-check)
+transport_stats = {
+    'transport': GEMINI_TRANSPORT,
+    'warmup_ms': None,
+    'last_ping_ms': None,
+    'pings': 0,
+    'ping_failures': 0,
+}
+
+_last_used = 0.0
+_keepalive_task = None
+
+
+def configure_gemini():
+    """Единственное место, где настраивается клиент Gemini"""
+    genai.configure(api_key=GEMINI_API_KEY, transport=GEMINI_TRANSPORT)
+
+
+def mark_used():
+    """Отметить реальный запрос - пинг в ближайший интервал не нужен"""
+    global _last_used
+    _last_used = time.monotonic()
+
+
+async def ping(key) -> float:
+    """
+    Дешевый запрос через тот же клиент, что и generate_content:
+    count_tokens не тратит квоту генерации. Возвращает задержку в мс.
+    Идет мимо key_pool.acquire(), чтобы не попадать в счетчики запросов ключа.
+    """
+    model = key.model(DEFAULT_MODEL)
+    started = time.monotonic()
+    await asyncio.to_thread(model.count_tokens, "ping")
+    mark_used()
+    return round((time.monotonic() - started) * 1000, 1)
+
+
+async def warm_up():
+    """Установить соединения всех ключей заранее (вызывается из on_startup)"""
+    results = await asyncio.gather(*(ping(key) for key in key_pool.keys), return_exceptions=True)
+    for key, result in zip(key_pool.keys, results):
+        if isinstance(result, Exception):
+            logger.warning("Не удалось прогреть соединение с Gemini (ключ %s): %s", key.label, result)
+            key_pool.report_error(key, result)
+            continue
+        transport_stats['warmup_ms'] = max(transport_stats['warmup_ms'] or 0, result)
+        logger.info("🔥 Соединение с Gemini прогрето (%s, ключ %s): %s мс", GEMINI_TRANSPORT, key.label, result)
+
+
+async def _keepalive_loop():
+    while True:
+        await asyncio.sleep(GEMINI_KEEPALIVE_SECONDS)
+        if time.monotonic() - _last_used < GEMINI_KEEPALIVE_SECONDS:
+            continue
+        # У каждого ключа свой канал - пингуем все доступные
+        keys = [key for key in key_pool.keys if key.is_available()]
+        results = await asyncio.gather(*(ping(key) for key in keys), return_exceptions=True)
+        latencies = []
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                transport_stats['ping_failures'] += 1
+                logger.warning("Пинг Gemini не прошел (ключ %s): %s", key.label, result)
+                continue
+            transport_stats['pings'] += 1
+            latencies.append(result)
+        if latencies:
+            transport_stats['last_ping_ms'] = max(latencies)
+            logger.debug("Пинг Gemini: %s мс (ключей: %d)", transport_stats['last_ping_ms'], len(latencies))
+
+
+def start_keepalive():
+    global _keepalive_task
+    if GEMINI_KEEPALIVE_SECONDS > 0 and _keepalive_task is None:
+        _keepalive_task = asyncio.create_task(_keepalive_loop())
+
+
+async def stop_keepalive():
+    global _keepalive_task
+    if _keepalive_task is not None:
+        _keepalive_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _keepalive_task
+        _keepalive_task = None
@@ -0,0 +1,70 @@
+"""
+Групповые чаты: дешевые фильтры, которые до любой работы с сессией и
+моделью решают, адресовано ли сообщение боту, и общая история чата.
+"""
+import re
+
+from config import GROUP_HISTORY_MESSAGES
+from utils.session_manager import UserSession, chat_sessions
+
+GROUP_CHAT_TYPES = {"group", "supergroup"}
+
+# Причины, по которым бот отвечает в группе
+ADDRESSED = ('reply', 'mention')
+
+# Срабатывания фильтров: сколько групповых сообщений дошло до Gemini
+group_stats = {
+    'messages': 0,
+    'no_text': 0,
+    'not_addressed': 0,
+    'reply': 0,
+    'mention': 0,
+}
+
+
+def classify(message, bot_id: int, bot_username: str) -> str:
+    """
+    Причина ответить ('reply' / 'mention') или причина пропустить.
+    Только сравнения полей сообщения - без сетевых вызовов.
+    """
+    text = message.text
+    if not text:
+        return 'no_text'
+
+    reply = message.reply_to_message
+    if reply is not None and reply.from_user is not None and reply.from_user.id == bot_id:
+        return 'reply'
+
+    if bot_username and '@' in text and f"@{bot_username.lower()}" in text.lower():
+        return 'mention'
+
+    return 'not_addressed'
+
+
+def count(reason: str):
+    group_stats['messages'] += 1
+    group_stats[reason] += 1
+
+
+def get_chat_session(chat_id: int) -> UserSession:
+    """Одна сессия на чат: история общая для всех участников"""
+    if chat_id not in chat_sessions:
+        session = UserSession(chat_id)
+        session.max_history = GROUP_HISTORY_MESSAGES
+        chat_sessions[chat_id] = session
+    return chat_sessions[chat_id]
+
+
+def group_prompt(message, bot_username: str) -> str:
+    """Текст для общей истории: без упоминания бота и с именем автора"""
+    text = message.text
+    if bot_username:
+        text = re.sub(re.escape(f"@{bot_username}"), "", text, flags=re.IGNORECASE).strip()
+    return f"{message.from_user.full_name}: {text}"
+
+
+def api_share() -> float:
+    """Доля групповых сообщений, дошедших до Gemini"""
+    if not group_stats['messages']:
+        return 0.0
+    return sum(group_stats[reason] for reason in ADDRESSED) / group_stats['messages']
@@ -0,0 +1,217 @@
+"""
+Фоновая очередь генерации изображений Imagen.
+Хэндлер /image только ставит задачу в очередь и сразу отвечает,
+а генерацию и скачивание выполняют отдельные воркеры со своим лимитом.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+from collections import deque
+
+import aiohttp
+from aiogram.enums import ParseMode
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+
+from config import GEMINI_TIMEOUT, IMAGE_WORKERS, IMAGE_QUEUE_MAX, IMAGE_JOBS_PER_USER
+from utils.gemini_engine import generate_images
+
+logger = logging.getLogger(__name__)
+
+CANCEL_PREFIX = "imgcancel_"
+
+_job_ids = itertools.count(1)
+
+
+class QueueFull(Exception):
+    """Общая очередь переполнена"""
+
+
+class UserLimitReached(Exception):
+    """У пользователя слишком много активных задач"""
+
+
+class ImageJob:
+    def __init__(self, message, prompt: str, variants: int):
+        self.id = next(_job_ids)
+        self.user_id = message.from_user.id
+        # Исходное сообщение: в его чат отправляется результат
+        self.message = message
+        self.prompt = prompt
+        self.variants = variants
+        # Сообщение со статусом, которое редактируется по ходу задачи.
+        # Воркер ждет его отправки, чтобы не начать раньше, чем оно появится
+        self.status_message = None
+        self.status_ready = asyncio.Event()
+        self.state = 'queued'
+        self.task = None
+
+    def cancel_markup(self):
+        return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+            text="❌ Отменить",
+            callback_data=f"{CANCEL_PREFIX}{self.id}"
+        )]])
+
+
+class ImageJobQueue:
+    def __init__(self, workers: int, max_size: int, per_user: int):
+        self.workers = workers
+        self.max_size = max_size
+        self.per_user = per_user
+        self._pending = deque()
+        self._running = {}
+        self._wakeup = asyncio.Condition()
+        self._worker_tasks = []
+        self._refresh_task = None
+        self._http = None
+        self.stats = {'queued': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+    def start(self):
+        if self._worker_tasks:
+            return
+        self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=GEMINI_TIMEOUT))
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self._running.values():
+            if job.task is not None:
+                job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        for task in self._worker_tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._worker_tasks = []
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    # --- ПОСТАНОВКА И ОТМЕНА ---
+    def active_jobs(self, user_id: int) -> list:
+        jobs = [job for job in self._pending if job.user_id == user_id]
+        jobs += [job for job in self._running.values() if job.user_id == user_id]
+        return jobs
+
+    def position(self, job: ImageJob) -> int:
+        return self._pending.index(job) + 1
+
+    async def submit(self, job: ImageJob) -> int:
+        """Поставить задачу в очередь. Возвращает позицию"""
+        if len(self.active_jobs(job.user_id)) >= self.per_user:
+            raise UserLimitReached(job.user_id)
+        if len(self._pending) >= self.max_size:
+            raise QueueFull()
+
+        self._pending.append(job)
+        self.stats['queued'] += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        return len(self._pending)
+
+    def cancel(self, job_id: int, user_id: int):
+        """Отменить задачу пользователя. Возвращает задачу или None"""
+        for job in self._pending:
+            if job.id == job_id and job.user_id == user_id:
+                self._pending.remove(job)
+                job.state = 'cancelled'
+                self.stats['cancelled'] += 1
+                return job
+
+        job = self._running.get(job_id)
+        if job is not None and job.user_id == user_id:
+            # Вызов Imagen в потоке прервать нельзя, но результат будет отброшен
+            job.state = 'cancelled'
+            job.task.cancel()
+            return job
+        return None
+
+    def cancel_all(self, user_id: int) -> list:
+        return [job for job in [self.cancel(job.id, user_id) for job in self.active_jobs(user_id)] if job]
+
+    # --- ВОРКЕРЫ ---
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._pending)
+                job = self._pending.popleft()
+
+            self._running[job.id] = job
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_positions())
+            try:
+                job.task = asyncio.create_task(self._run(job))
+                await job.task
+                self.stats['done'] += 1
+            except asyncio.CancelledError:
+                if job.state != 'cancelled':
+                    raise
+                self.stats['cancelled'] += 1
+                await self._set_status(job, "🚫 Генерация отменена")
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error("Ошибка генерации изображения: %s", e, extra={'user_id': job.user_id, 'model': 'imagen-3', 'handler': 'image_job'})
+                await self._set_status(
+                    job,
+                    "❌ *Не удалось создать изображение*\n\n"
+                    "Попробуйте:\n"
+                    "• Изменить описание\n"
+                    "• Сделать запрос проще\n"
+                    "• Попробовать позже"
+                )
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _run(self, job: ImageJob):
+        await job.status_ready.wait()
+        job.state = 'generating'
+        await self._set_status(job, "🎨 Генерирую изображение...", cancellable=True)
+
+        # Все варианты - одним вызовом generate_images
+        response = await generate_images(job.prompt, number_of_images=job.variants)
+        if not response.images:
+            raise ValueError("API не вернул изображение")
+
+        job.state = 'uploading'
+        await self._set_status(job, "📤 Загружаю результат...")
+
+        photos = []
+        for index, image in enumerate(response.images):
+            async with self._http.get(image._image_url) as img_response:
+                img_response.raise_for_status()
+                photos.append(BufferedInputFile(await img_response.read(), filename=f"image_{job.id}_{index}.png"))
+
+        caption = f"🎨 *Создано по запросу:*\n{job.prompt}"
+        message = job.message
+        if len(photos) == 1:
+            await message.answer_photo(photo=photos[0], caption=caption, parse_mode=ParseMode.MARKDOWN)
+        else:
+            media = [InputMediaPhoto(media=photo) for photo in photos]
+            media[0] = InputMediaPhoto(media=photos[0], caption=caption, parse_mode=ParseMode.MARKDOWN)
+            await message.answer_media_group(media=media)
+
+        job.state = 'done'
+        if job.status_message is not None:
+            with contextlib.suppress(Exception):
+                await job.status_message.delete()
+
+    # --- СТАТУС ---
+    async def _set_status(self, job: ImageJob, text: str, cancellable: bool = False):
+        if job.status_message is None:
+            return
+        try:
+            await job.status_message.edit_text(
+                text,
+                reply_markup=job.cancel_markup() if cancellable else None,
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.debug("Не удалось обновить статус задачи %s: %s", job.id, e)
+
+    async def _refresh_positions(self):
+        """После каждого извлечения из очереди обновляем позиции ожидающих"""
+        for position, job in enumerate(list(self._pending), start=1):
+            await self._set_status(job, f"⏳ В очереди, позиция {position}", cancellable=True)
+
+
+image_queue = ImageJobQueue(IMAGE_WORKERS, IMAGE_QUEUE_MAX, IMAGE_JOBS_PER_USER)
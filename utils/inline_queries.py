@@ -0,0 +1,118 @@
+"""
+Inline-режим: Telegram присылает запрос почти на каждое нажатие клавиши.
+До Gemini доходит только запрос, после которого пользователь сделал паузу;
+более ранние отменяются, а готовые ответы кэшируются на короткое время.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+
+from config import INLINE_DEBOUNCE_MS, INLINE_CACHE_TTL_SECONDS, INLINE_CACHE_MAX
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class InlineDebouncer:
+    def __init__(self, delay: float, ttl: float, max_size: int):
+        self.delay = delay
+        self.ttl = ttl
+        self.max_size = max_size
+        # Последний запрос пользователя (ожидание паузы + вызов): user_id -> task
+        self._pending = {}
+        # Вызов Gemini пользователя, не больше одного: user_id -> task
+        self._calls = {}
+        # (модель, запрос) -> (истекает, ответ)
+        self._cache = OrderedDict()
+        self.stats = {'queries': 0, 'superseded': 0, 'cache_hits': 0, 'gemini_calls': 0}
+
+    # --- КЭШ ---
+    def _get_cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, text = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return text
+
+    def _put(self, key, text: str):
+        self._cache[key] = (time.monotonic() + self.ttl, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    # --- ЗАПРОСЫ ---
+    async def resolve(self, user_id: int, key, call):
+        """
+        Ответ на запрос или None, если пользователь успел набрать новый.
+        call - фабрика корутины с вызовом Gemini, вызывается не больше раза.
+        """
+        self.stats['queries'] += 1
+        # Новый запрос вытесняет ожидающий, даже если сам ответ уже в кэше
+        previous = self._pending.get(user_id)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.stats['superseded'] += 1
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        task = asyncio.create_task(self._debounced(user_id, key, call))
+        self._pending[user_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                # Запрос вытеснен более новым
+                return None
+            raise
+        finally:
+            if self._pending.get(user_id) is task:
+                del self._pending[user_id]
+
+    async def _debounced(self, user_id: int, key, call):
+        await asyncio.sleep(self.delay)
+
+        # Дожидаемся предыдущего вызова: вызов в потоке прервать нельзя,
+        # а второй параллельный только удвоит расход
+        running = self._calls.get(user_id)
+        if running is not None and not running.done():
+            with contextlib.suppress(Exception):
+                await asyncio.shield(running)
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        running = asyncio.create_task(self._call(key, call))
+        running.add_done_callback(lambda done: self._forget_call(user_id, done))
+        self._calls[user_id] = running
+        # Отмена ожидания не отменяет вызов: его ответ попадет в кэш
+        return await asyncio.shield(running)
+
+    def _forget_call(self, user_id: int, done: asyncio.Task):
+        if self._calls.get(user_id) is done:
+            del self._calls[user_id]
+        # Ошибка вызова, ответ которого уже никто не ждет, только логируется
+        if not done.cancelled() and done.exception() is not None:
+            logger.debug("Inline-запрос пользователя %s завершился ошибкой: %s", user_id, done.exception())
+
+    async def _call(self, key, call) -> str:
+        self.stats['gemini_calls'] += 1
+        text = await call()
+        self._put(key, text)
+        return text
+
+
+inline_debouncer = InlineDebouncer(INLINE_DEBOUNCE_MS / 1000, INLINE_CACHE_TTL_SECONDS, INLINE_CACHE_MAX)
@@ -0,0 +1,209 @@
+"""
+Пул API-ключей Gemini. У каждого ключа свои клиенты и свои счетчики;
+запросы распределяются по ключу, который дольше всех не использовался.
+Ключ, получивший 429 или ошибку авторизации, временно выводится из
+ротации и возвращается после успешной проверки.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+# Клиенты на ключ держатся на внутренностях google-generativeai 0.8.6
+# (версия закреплена в requirements.txt): _ClientManager и GenerativeModel._client.
+# Публичного API для нескольких ключей в одном процессе у библиотеки нет
+from google.generativeai.client import _ClientManager
+
+from config import (
+    GEMINI_API_KEYS, GEMINI_TRANSPORT, GEMINI_KEY_RPM,
+    GEMINI_KEY_COOLDOWN_SECONDS, GEMINI_KEY_PROBE_INTERVAL_SECONDS, DEFAULT_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _check_genai_internals():
+    """
+    После обновления библиотеки падаем сразу при импорте, а не тихо
+    отправляем все запросы через общий клиент по умолчанию.
+    """
+    if not hasattr(_ClientManager, 'get_default_client') or not hasattr(_ClientManager, 'configure'):
+        raise RuntimeError("google-generativeai: не найден _ClientManager с клиентами на ключ")
+    if '_client' not in vars(genai.GenerativeModel(DEFAULT_MODEL)):
+        raise RuntimeError("google-generativeai: у GenerativeModel нет атрибута _client")
+
+
+_check_genai_internals()
+
+
+def key_error_reason(error: Exception):
+    """Причина вывести ключ из ротации или None, если ошибка не связана с ключом"""
+    if isinstance(error, api_exceptions.TooManyRequests):
+        return 'rate_limited'
+    if isinstance(error, (api_exceptions.Unauthorized, api_exceptions.Forbidden)):
+        return 'auth_error'
+    # Неверный ключ Gemini отклоняет с 400, а не 401/403
+    if isinstance(error, api_exceptions.InvalidArgument) and "API key not valid" in str(error):
+        return 'auth_error'
+    return None
+
+
+class NoAvailableKeys(Exception):
+    """Все ключи временно выведены из ротации"""
+
+
+class ApiKey:
+    def __init__(self, index: int, key: str):
+        self.index = index
+        self.key = key
+        self.label = f"#{index + 1} (…{key[-4:]})"
+        self._clients = _ClientManager()
+        self._clients.configure(api_key=key, transport=GEMINI_TRANSPORT)
+        self.last_used = 0.0
+        self.disabled_until = 0.0
+        self.disabled_reason = None
+        self._recent = deque()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'auth_errors': 0}
+
+    @property
+    def generative_client(self):
+        return self._clients.get_default_client("generative")
+
+    @property
+    def file_client(self):
+        return self._clients.get_default_client("file")
+
+    def model(self, model_id: str) -> genai.GenerativeModel:
+        """GenerativeModel, привязанная к клиенту этого ключа"""
+        model = genai.GenerativeModel(model_id)
+        # Клиент по умолчанию общий для процесса; подставляем клиент ключа
+        model._client = self.generative_client
+        return model
+
+    def requests_last_minute(self) -> int:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        return len(self._recent)
+
+    def is_available(self) -> bool:
+        return self.disabled_reason is None
+
+
+class KeyPool:
+    def __init__(self, keys: list[str]):
+        self.keys = [ApiKey(index, key) for index, key in enumerate(keys)]
+        self._probe_task = None
+
+    def acquire(self) -> ApiKey:
+        """Ключ, который дольше всех не использовался, с учетом лимита запросов в минуту"""
+        available = [key for key in self.keys if key.is_available()]
+        if not available:
+            raise NoAvailableKeys()
+
+        if GEMINI_KEY_RPM:
+            under_limit = [key for key in available if key.requests_last_minute() < GEMINI_KEY_RPM]
+            available = under_limit or available
+
+        key = min(available, key=lambda k: k.last_used)
+        now = time.monotonic()
+        key.last_used = now
+        key._recent.append(now)
+        key.stats['requests'] += 1
+        return key
+
+    def report_error(self, key: ApiKey, error: Exception) -> bool:
+        """
+        Учесть ошибку; при 429 или ошибке ключа вывести ключ из ротации.
+        Возвращает True, если ключ выведен (запрос имеет смысл повторить на другом).
+        """
+        key.stats['errors'] += 1
+        reason = key_error_reason(error)
+        if reason is None:
+            return False
+        key.stats['rate_limited' if reason == 'rate_limited' else 'auth_errors'] += 1
+        self._disable(key, reason)
+        return True
+
+    async def call(self, fn, key: ApiKey = None):
+        """
+        Выполнить fn(key) в потоке. Если ключ получил 429 или отклонен, запрос
+        один раз повторяется на другом ключе. Ключ, переданный явно (к нему
+        привязаны загруженные файлы), не подменяется.
+        """
+        pinned = key is not None
+        key = key or self.acquire()
+        try:
+            return await asyncio.to_thread(fn, key)
+        except Exception as e:
+            if not self.report_error(key, e) or pinned:
+                raise
+            try:
+                retry_key = self.acquire()
+            except NoAvailableKeys:
+                raise e from None
+
+        logger.warning("Повтор запроса к Gemini на ключе %s", retry_key.label)
+        try:
+            return await asyncio.to_thread(fn, retry_key)
+        except Exception as e:
+            self.report_error(retry_key, e)
+            raise
+
+    def _disable(self, key: ApiKey, reason: str):
+        if key.disabled_reason is None:
+            logger.warning("🔑 Ключ %s выведен из ротации: %s", key.label, reason)
+        key.disabled_reason = reason
+        key.disabled_until = time.monotonic() + GEMINI_KEY_COOLDOWN_SECONDS
+
+    async def probe(self, key: ApiKey) -> bool:
+        """Проверка ключа дешевым запросом count_tokens"""
+        try:
+            await asyncio.to_thread(key.model(DEFAULT_MODEL).count_tokens, "ping")
+        except Exception as e:
+            logger.debug("Проверка ключа %s не прошла: %s", key.label, e)
+            return False
+        return True
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(GEMINI_KEY_PROBE_INTERVAL_SECONDS)
+            now = time.monotonic()
+            for key in self.keys:
+                if key.is_available() or key.disabled_until > now:
+                    continue
+                if await self.probe(key):
+                    key.disabled_reason = None
+                    logger.info("🔑 Ключ %s возвращен в ротацию", key.label)
+                else:
+                    key.disabled_until = now + GEMINI_KEY_COOLDOWN_SECONDS
+
+    def start(self):
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._probe_task
+            self._probe_task = None
+
+    def report(self) -> list[dict]:
+        """Счетчики по ключам (без самих ключей)"""
+        return [
+            {
+                'key': key.label,
+                'available': key.is_available(),
+                'disabled_reason': key.disabled_reason,
+                'rpm': key.requests_last_minute(),
+                **key.stats,
+            }
+            for key in self.keys
+        ]
+
+
+key_pool = KeyPool(GEMINI_API_KEYS)
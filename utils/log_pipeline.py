@@ -0,0 +1,139 @@
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Поля, которые хэндлеры передают через extra=...
+CONTEXT_FIELDS = ('user_id', 'model', 'handler', 'latency_ms')
+
+# Счетчики пайплайна логирования
+log_stats = {
+    'dropped': 0,
+    'sampled_out': 0,
+}
+
+_traceback_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        if record.stack_info:
+            data['stack_info'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю INFO/DEBUG записей из шумных логгеров
+    (или помеченных extra={'sample': True}). WARNING и выше не трогаем.
+    """
+
+    def __init__(self, rate: float, loggers: tuple[str, ...]):
+        super().__init__()
+        self.rate = rate
+        self.loggers = loggers
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        if not (getattr(record, 'sample', False) or record.name.startswith(self.loggers)):
+            return True
+        if random.random() < self.rate:
+            return True
+        log_stats['sampled_out'] += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполненной очереди выбрасывает запись, а не ждет"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats['dropped'] += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В event loop только подставляем аргументы (они могут измениться позже),
+        # форматирование целиком выполняет поток слушателя
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_log_pipeline(
+    level: str,
+    log_file: str = None,
+    json_format: bool = True,
+    sample_rate: float = 1.0,
+    sampled_loggers: tuple[str, ...] = (),
+    queue_size: int = 10000,
+    file_max_bytes: int = 10 * 1024 * 1024,
+    file_backup_count: int = 5,
+) -> QueueListener:
+    """
+    Настроить асинхронное логирование: корутины только кладут запись в очередь,
+    запись в stdout и файл выполняется в отдельном потоке QueueListener.
+    """
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+    handlers = []
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    handlers.append(stream_handler)
+
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=file_max_bytes,
+            backupCount=file_backup_count,
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate, sampled_loggers))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,102 @@
+"""
+Сторож event loop: измеряет задержку планирования и, если loop
+завис дольше порога, логирует стек кода, который его блокирует.
+"""
+import asyncio
+import contextlib
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import LOOP_LAG_INTERVAL_MS, LOOP_LAG_THRESHOLD_MS, LOOP_LAG_UNHEALTHY_MS
+
+logger = logging.getLogger(__name__)
+
+# Окно последних замеров (~5 секунд при интервале 100 мс)
+LAG_WINDOW = 50
+
+lag_stats = {
+    'last_ms': 0.0,
+    'max_recent_ms': 0.0,
+    'stalls': 0,
+}
+
+_samples = deque(maxlen=LAG_WINDOW)
+_heartbeat = time.monotonic()
+_task = None
+_thread = None
+_stop = threading.Event()
+
+
+def is_overloaded() -> bool:
+    """Loop недавно зависал дольше LOOP_LAG_UNHEALTHY_MS"""
+    stalled_ms = (time.monotonic() - _heartbeat) * 1000 if _task is not None else 0.0
+    return max(lag_stats['max_recent_ms'], stalled_ms) > LOOP_LAG_UNHEALTHY_MS
+
+
+async def _measure():
+    """Замер задержки: насколько позже запланированного мы проснулись"""
+    global _heartbeat
+    interval = LOOP_LAG_INTERVAL_MS / 1000
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        _heartbeat = now
+
+        lag_ms = max((now - started - interval) * 1000, 0.0)
+        _samples.append(lag_ms)
+        lag_stats['last_ms'] = round(lag_ms, 1)
+        lag_stats['max_recent_ms'] = round(max(_samples), 1)
+
+
+def _watch(loop_thread_id: int):
+    """
+    Поток-наблюдатель: если heartbeat не обновлялся дольше порога, loop
+    занят синхронным кодом - снимаем стек основного потока прямо во время зависания.
+    """
+    threshold = LOOP_LAG_THRESHOLD_MS / 1000
+    reported = None
+    while not _stop.wait(LOOP_LAG_INTERVAL_MS / 1000):
+        beat = _heartbeat
+        stalled = time.monotonic() - beat
+        if stalled < threshold or reported == beat:
+            continue
+
+        # Один отчет на одно зависание
+        reported = beat
+        lag_stats['stalls'] += 1
+        frame = sys._current_frames().get(loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "стек недоступен"
+        logger.warning(
+            "⚠️ Event loop заблокирован уже %.0f мс, стек:\n%s",
+            stalled * 1000, stack,
+            extra={'latency_ms': round(stalled * 1000)}
+        )
+
+
+def start_watchdog():
+    global _task, _thread, _heartbeat
+    if _task is not None:
+        return
+    _heartbeat = time.monotonic()
+    _stop.clear()
+    _task = asyncio.create_task(_measure())
+    _thread = threading.Thread(
+        target=_watch, args=(threading.get_ident(),), name="loop-watchdog", daemon=True
+    )
+    _thread.start()
+
+
+async def stop_watchdog():
+    global _task, _thread
+    _stop.set()
+    if _task is not None:
+        _task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _task
+        _task = None
+    _thread = None
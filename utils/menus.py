@@ -0,0 +1,105 @@
+"""
+Готовые тексты и клавиатуры для /start, /help и меню /models.
+Все собирается один раз из GEMINI_MODELS при импорте; для пользователя
+выбирается готовый вариант по текущей модели (отличается только галочкой).
+"""
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from utils.gemini_engine import GEMINI_MODELS
+
+BACK_BUTTON = InlineKeyboardButton(text="🔙 Назад", callback_data="models_back")
+
+HELP_TEXT = (
+    "📖 *Помощь*\n\n"
+    "*Как использовать:*\n"
+    "1. Напишите любой вопрос\n"
+    "2. Отправьте фото для анализа\n"
+    "3. Используйте /image для генерации картинок\n\n"
+    "*Советы:*\n"
+    "• Используйте /models для смены модели\n"
+    "• Gemini 3.0 Flash - самая новая и мощная\n"
+    "• Imagen 3 - только для генерации изображений\n"
+    "• /clear если ответы стали странными\n\n"
+    "*Примеры запросов:*\n"
+    "• `Объясни теорию относительности`\n"
+    "• `Напиши код сайта на Python`\n"
+    "• `Что на этом фото?` (отправьте фото)\n"
+    "• `/image космический корабль в туманности`"
+)
+
+
+def _start_text(model: dict) -> str:
+    return (
+        f"🤖 *Gemini Bot v2.0*\n\n"
+        f"Текущая модель: *{model['name']}*\n\n"
+        "✨ *Возможности:*\n"
+        "• 💬 Умный чат с контекстом\n"
+        "• 🖼️ Анализ изображений\n"
+        "• 📄 Анализ документов (PDF, код, логи)\n"
+        "• 🎤 Голосовые сообщения\n"
+        "• 💻 Генерация кода\n"
+        "• 🎨 Создание картинок\n\n"
+        "📋 *Команды:*\n"
+        "/models - Выбрать модель\n"
+        "/clear - Очистить историю\n"
+        "/image - Создать картинку\n"
+        "/cancel - Отменить генерацию\n"
+        "/help - Справка\n\n"
+        "*Просто отправьте сообщение или фото!*"
+    )
+
+
+def _models_text(model: dict) -> str:
+    return f"🤖 *Выбор модели*\n\n📊 Текущая: {model['name']}\n\nВыберите категорию:"
+
+
+def _text_models_markup(models: dict, current: str) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(
+            text=f"{'✅ ' if model_id == current else ''}{model['name']}",
+            callback_data=f"model_{model_id}"
+        )]
+        for model_id, model in models.items()
+    ]
+    keyboard.append([BACK_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def _selected_text(model: dict) -> str:
+    return (
+        f"✅ *Модель выбрана!*\n\n"
+        f"🤖 *{model['name']}*\n"
+        f"📝 {model['description']}\n\n"
+        f"Теперь вы можете использовать {'текстовый чат' if model['category'] == 'text' else 'генерацию изображений'}"
+    )
+
+
+# --- СБОРКА ---
+TEXT_MODELS = {k: v for k, v in GEMINI_MODELS.items() if v['category'] == 'text'}
+IMAGE_MODEL = GEMINI_MODELS['imagen-3']
+
+START_TEXTS = {model_id: _start_text(model) for model_id, model in GEMINI_MODELS.items()}
+MODELS_TEXTS = {model_id: _models_text(model) for model_id, model in GEMINI_MODELS.items()}
+SELECTED_TEXTS = {model_id: _selected_text(model) for model_id, model in GEMINI_MODELS.items()}
+
+MODELS_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💬 Текстовые модели", callback_data="category_text")],
+    [InlineKeyboardButton(text="🎨 Генерация изображений", callback_data="category_image")],
+])
+
+TEXT_MODELS_TEXT = "💬 *Текстовые модели:*\n\n" + "\n".join(
+    f"• {model['name']} - {model['description']}" for model in TEXT_MODELS.values()
+)
+# Вариант клавиатуры на каждую текущую модель; для imagen галочки нет
+TEXT_MODELS_MARKUPS = {model_id: _text_models_markup(TEXT_MODELS, model_id) for model_id in GEMINI_MODELS}
+
+IMAGE_MODELS_TEXT = (
+    "🎨 *Генерация изображений:*\n\n"
+    f"*{IMAGE_MODEL['name']}*\n"
+    f"{IMAGE_MODEL['description']}\n\n"
+    "Для генерации используйте команду /image"
+)
+IMAGE_MODELS_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=f"🎨 {IMAGE_MODEL['name']}", callback_data="model_imagen-3")],
+    [BACK_BUTTON],
+])
@@ -0,0 +1,157 @@
+"""
+Планировщик исходящих запросов к Telegram.
+Подключается как request-middleware к сессии Bot: соблюдает лимиты
+на чат и глобальный лимит, ждет retry_after при flood control и
+склеивает подряд идущие правки одного сообщения.
+"""
+import asyncio
+import bisect
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    SendMessage, SendPhoto, SendDocument, SendMediaGroup, SendAudio, SendVoice,
+    CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia,
+)
+
+logger = logging.getLogger(__name__)
+
+SEND_METHODS = (
+    SendMessage, SendPhoto, SendDocument, SendMediaGroup, SendAudio, SendVoice,
+    CopyMessage, ForwardMessage,
+)
+EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia)
+
+# Метрики исходящих запросов
+send_stats = {
+    'sent': 0,
+    'delayed': 0,
+    'delay_seconds': 0.0,
+    'retry_after': 0,
+    'merged_edits': 0,
+    'dropped': 0,
+}
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self, global_per_second: float, chat_per_second: float, group_per_minute: float, max_retries: int):
+        self.global_interval = 1 / global_per_second
+        self.chat_interval = 1 / chat_per_second
+        self.group_interval = 60 / group_per_minute
+        self.max_retries = max_retries
+        # Занятые слоты глобальной очереди (отсортированы) и глобальный
+        # flood control; слоты чатов ведутся отдельно и общую очередь не двигают
+        self._global_slots = []
+        self._global_blocked_until = 0.0
+        # Время, раньше которого следующий запрос в чат не уходит
+        self._next_chat = {}
+        # Правки, ожидающие своей очереди: (тип, chat_id, message_id) -> запись
+        self._pending_edits = {}
+
+    def _chat_interval(self, chat_id) -> float:
+        # У групп и каналов id отрицательные, лимит у них строже
+        if isinstance(chat_id, int) and chat_id < 0:
+            return self.group_interval
+        return self.chat_interval
+
+    async def _acquire(self, chat_id):
+        """Занять слот в глобальной очереди и в очереди чата"""
+        now = time.monotonic()
+        start = max(now, self._global_blocked_until, self._next_chat.get(chat_id, 0.0))
+        start = self._reserve_global(now, start)
+        self._next_chat[chat_id] = start + self._chat_interval(chat_id)
+
+        # Старые записи чатов не нужны
+        if len(self._next_chat) > 10000:
+            self._next_chat = {k: v for k, v in self._next_chat.items() if v > now}
+
+        delay = start - now
+        if delay > 0:
+            send_stats['delayed'] += 1
+            send_stats['delay_seconds'] += delay
+            await asyncio.sleep(delay)
+
+    def _reserve_global(self, now: float, earliest: float) -> float:
+        """
+        Первый свободный глобальный слот не раньше earliest. Ожидание одного
+        чата не задерживает отправку в другие чаты.
+        """
+        interval = self.global_interval
+        slots = self._global_slots
+        del slots[:bisect.bisect_left(slots, now - interval)]
+
+        start = earliest
+        index = bisect.bisect_right(slots, start - interval)
+        while index < len(slots) and slots[index] < start + interval:
+            start = slots[index] + interval
+            index += 1
+        slots.insert(index, start)
+        return start
+
+    def _block(self, chat_id, seconds: float):
+        """После flood control чат (или весь бот) молчит retry_after секунд"""
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._global_blocked_until = max(self._global_blocked_until, until)
+        else:
+            self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), until)
+
+    async def _send(self, make_request, bot, method, chat_id, acquired: bool = False):
+        for attempt in range(self.max_retries + 1):
+            if attempt or not acquired:
+                await self._acquire(chat_id)
+            try:
+                result = await make_request(bot, method)
+                send_stats['sent'] += 1
+                return result
+            except TelegramRetryAfter as e:
+                send_stats['retry_after'] += 1
+                self._block(chat_id, e.retry_after)
+                logger.warning(
+                    "Flood control в чате %s: ждем %s с (попытка %d)",
+                    chat_id, e.retry_after, attempt + 1
+                )
+                if attempt == self.max_retries:
+                    send_stats['dropped'] += 1
+                    raise
+
+    async def _edit(self, make_request, bot, method, chat_id):
+        key = (type(method), chat_id, getattr(method, 'message_id', None) or getattr(method, 'inline_message_id', None))
+
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Предыдущая правка еще не ушла - отправится только последняя версия
+            pending['method'] = method
+            pending['waiters'] += 1
+            send_stats['merged_edits'] += 1
+            return await asyncio.shield(pending['future'])
+
+        future = asyncio.get_running_loop().create_future()
+        entry = {'method': method, 'future': future, 'waiters': 0}
+        self._pending_edits[key] = entry
+        try:
+            try:
+                await self._acquire(chat_id)
+            finally:
+                # После получения слота новые правки идут уже следующим запросом
+                self._pending_edits.pop(key, None)
+            result = await self._send(make_request, bot, entry['method'], chat_id, acquired=True)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if entry['waiters']:
+                future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, EDIT_METHODS):
+            return await self._edit(make_request, bot, method, getattr(method, 'chat_id', None))
+        if isinstance(method, SEND_METHODS):
+            return await self._send(make_request, bot, method, method.chat_id)
+        return await make_request(bot, method)
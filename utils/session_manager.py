@@ -1,13 +1,22 @@
 from datetime import datetime
-from config import DEFAULT_MODEL
+from config import DEFAULT_MODEL, MAX_HISTORY_MESSAGES
 
 class UserSession:
     def __init__(self, user_id: int):
         self.user_id = user_id
         self.history = []
+        # Лимит истории (у групповых чатов свой)
+        self.max_history = MAX_HISTORY_MESSAGES
         self.current_model = DEFAULT_MODEL
         self.created_at = datetime.now()
         self.message_count = 0
         self.last_activity = datetime.now()
+        # Учет токенов: {model: {'input': n, 'output': n}} за все время
+        self.token_usage = {}
+        # Токены за текущие сутки (сбрасываются при смене даты)
+        self.daily_tokens = 0
+        self.usage_day = datetime.now().date()
 
-user_sessions = {}
\ No newline at end of file
+user_sessions = {}
+# Общие сессии групповых чатов: chat_id -> UserSession
+chat_sessions = {}
\ No newline at end of file
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from config import (
+    ADMIN_IDS,
+    USAGE_DAILY_TOKENS_PER_USER,
+    USAGE_DOWNGRADE_ENABLED,
+    USAGE_DOWNGRADE_THRESHOLD,
+    USAGE_DOWNGRADE_MODEL,
+)
+from utils.session_manager import UserSession, user_sessions
+
+# Суммарный расход по моделям: {model: {'input': n, 'output': n}}
+model_usage = {}
+
+
+def reset_daily_usage(session: UserSession):
+    """Сбросить дневной счетчик, если наступили новые сутки"""
+    today = datetime.now().date()
+    if session.usage_day != today:
+        session.usage_day = today
+        session.daily_tokens = 0
+
+
+def _add(counters: dict, model: str, input_tokens: int, output_tokens: int):
+    entry = counters.setdefault(model, {'input': 0, 'output': 0})
+    entry['input'] += input_tokens
+    entry['output'] += output_tokens
+
+
+def record_usage(session: UserSession, model: str, response) -> int:
+    """Учесть токены из response.usage_metadata. Возвращает сумму токенов запроса"""
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is None:
+        return 0
+
+    input_tokens = getattr(metadata, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(metadata, 'candidates_token_count', 0) or 0
+
+    reset_daily_usage(session)
+    _add(session.token_usage, model, input_tokens, output_tokens)
+    _add(model_usage, model, input_tokens, output_tokens)
+    session.daily_tokens += input_tokens + output_tokens
+    return input_tokens + output_tokens
+
+
+def admit_model(session: UserSession, model: str):
+    """
+    Проверить дневной бюджет перед вызовом Gemini.
+    Возвращает модель, которую можно использовать (возможно, более дешевую),
+    или None, если бюджет исчерпан.
+    """
+    if not USAGE_DAILY_TOKENS_PER_USER or session.user_id in ADMIN_IDS:
+        return model
+
+    reset_daily_usage(session)
+    if session.daily_tokens >= USAGE_DAILY_TOKENS_PER_USER:
+        return None
+
+    if USAGE_DOWNGRADE_ENABLED and session.daily_tokens >= USAGE_DAILY_TOKENS_PER_USER * USAGE_DOWNGRADE_THRESHOLD:
+        return USAGE_DOWNGRADE_MODEL
+
+    return model
+
+
+def total_tokens(session: UserSession) -> int:
+    return sum(entry['input'] + entry['output'] for entry in session.token_usage.values())
+
+
+def top_consumers(limit: int = 10):
+    """Пользователи с наибольшим расходом токенов за сегодня"""
+    for session in user_sessions.values():
+        reset_daily_usage(session)
+    sessions = [s for s in user_sessions.values() if s.token_usage]
+    sessions.sort(key=lambda s: (s.daily_tokens, total_tokens(s)), reverse=True)
+    return sessions[:limit]